@@ -0,0 +1,192 @@
+import asyncio
+import tempfile
+from asyncio.subprocess import PIPE
+from pathlib import Path
+from subprocess import CalledProcessError
+from braulio.git import (
+    Commit,
+    log_format,
+    _log_command,
+    _parse_tag_list,
+    _hashable_label_pattern,
+    _tag_regexp,
+    _tag_version,
+    get_label_matcher,
+)
+
+
+async def _run_command(command, cwd=None):
+    process = await asyncio.create_subprocess_exec(
+        *command, stdout=PIPE, stderr=PIPE, cwd=cwd
+    )
+    stdout, stderr = await process.communicate()
+
+    if process.returncode:
+        raise CalledProcessError(process.returncode, command, stdout, stderr)
+
+    return stdout.decode()
+
+
+async def _stream_command(command, separator=b"\n", cwd=None, chunk_size=65536):
+    """Asynchronous version of :func:`braulio.git._stream_command`."""
+
+    with tempfile.TemporaryFile() as stderr_file:
+        process = await asyncio.create_subprocess_exec(
+            *command, stdout=PIPE, stderr=stderr_file, cwd=cwd
+        )
+
+        try:
+            remainder = b""
+
+            while True:
+                chunk = await process.stdout.read(chunk_size)
+
+                if not chunk:
+                    break
+
+                records = (remainder + chunk).split(separator)
+                remainder = records.pop()
+
+                for record in records:
+                    yield record.decode()
+
+            if remainder:
+                yield remainder.decode()
+
+            if await process.wait():
+                stderr_file.seek(0)
+                stderr = stderr_file.read()
+                raise CalledProcessError(process.returncode, command, stderr=stderr)
+        finally:
+            # The consumer stopped before the output was exhausted
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+
+
+class AsyncGit:
+    """Asynchronous counterpart of :class:`~braulio.git.Git`, built on
+    :func:`asyncio.create_subprocess_exec`.
+
+    Since many repositories can be handled from a single event loop, the
+    repository directory is given in ``path`` instead of taken from the
+    current working directory.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+
+    async def add(self, *files):
+        """Add one or more files to the index running git-add."""
+
+        try:
+            await _run_command(("git", "add") + files, cwd=self.path)
+        except CalledProcessError:
+            for f in files:
+                if not Path(self.path or ".", f).exists():
+                    raise FileNotFoundError(f"No such file or directory: {f}")
+
+    async def commit(self, message, files=None):
+        """Run git-commit."""
+
+        if files:
+            await self.add(*files)
+
+        command = ["git", "commit", "-m", f'"{message}"']
+        return await _run_command(command, cwd=self.path)
+
+    async def iter_log(self, _from=None, to=None):
+        """Run git-log yielding :class:`~braulio.git.Commit` objects as they
+        are read from the command output."""
+
+        command = _log_command(_from, to) + log_format
+        fields = _stream_command(command, separator=b"\0", cwd=self.path)
+
+        # Fields come in (hash, message) pairs
+        async for commit_hash in fields:
+            message = await fields.__anext__()
+            yield Commit.from_fields(commit_hash, message)
+
+    async def log(self, _from=None, to=None):
+        """Run git-log."""
+
+        return [commit async for commit in self.iter_log(_from, to)]
+
+    async def tag(self, name=None):
+        """Create and list tag objects running git-tag command"""
+
+        command = ["git", "tag"]
+
+        if not name:
+            command.extend(
+                [
+                    "-l",
+                    "--sort=creatordate",
+                    "--format=%(creatordate:short)%09%(refname:strip=2)",
+                ]
+            )
+
+            return _parse_tag_list(await _run_command(command, cwd=self.path))
+
+        command.extend(["-a", name, "-m", '""'])
+        return await _run_command(command, cwd=self.path)
+
+
+async def _aiter(iterable):
+    if hasattr(iterable, "__aiter__"):
+        async for item in iterable:
+            yield item
+    else:
+        for item in iterable:
+            yield item
+
+
+async def async_commit_analyzer(commits, label_pattern, label_position="footer"):
+    """Same as :func:`~braulio.git.commit_analyzer`, but ``commits`` can also
+    be an asynchronous iterable, like the one returned by
+    :meth:`AsyncGit.iter_log`, so commits are analyzed while they are read.
+    """
+
+    label_pattern = _hashable_label_pattern(label_pattern)
+    match = get_label_matcher(label_pattern, label_position).match
+    semantic_commits = []
+
+    async for commit in _aiter(commits):
+        sc = match(commit)
+
+        if sc is not None:
+            semantic_commits.append(sc)
+
+    return semantic_commits
+
+
+async def async_tag_analyzer(tags, tag_pattern, Version):
+    """Same as :func:`~braulio.git.tag_analyzer`, but ``tags`` can also be an
+    asynchronous iterable or an awaitable, like :meth:`AsyncGit.tag`."""
+
+    if asyncio.iscoroutine(tags) or isinstance(tags, asyncio.Future):
+        tags = await tags
+
+    tag_regex = _tag_regexp(tag_pattern, Version)
+    versions = []
+
+    async for tag in _aiter(tags):
+        version = _tag_version(tag_regex, tag, Version)
+
+        if version is not None:
+            versions.append(version)
+
+    return versions
+
+
+async def gather_bounded(coroutines, limit):
+    """Run the given coroutines concurrently, at most ``limit`` of them at a
+    time, and return their results in the same order."""
+
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    return await asyncio.gather(*(run(coroutine) for coroutine in coroutines))
@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+from braulio.git import Tag
+
+
+# Bump it every time the format of the cache files changes, so old files
+# are discarded instead of being misread.
+CACHE_FORMAT = 1
+
+
+class TagCache:
+    """Persistent map of tag names to the version parsed from them by
+    :func:`~braulio.git.tag_analyzer`, so each tag is matched against the
+    tag pattern only once.
+
+    Along with the versions, the tag list and a ``watermark`` of the tag
+    references (see :func:`braulio.objects.refs_watermark`) are stored.
+    While the watermark doesn't change, the stored :attr:`tags` can be used
+    instead of listing the tags again.
+
+    The stored entries are discarded if the tag pattern or the version
+    stages change.
+    """
+
+    def __init__(self, path, tag_pattern, Version):
+        self.path = path
+        self.fingerprint = _stages_fingerprint(tag_pattern, Version)
+        self.watermark = None
+        self.tags = []
+        self._versions = {}
+        self._modified = False
+
+        self._load(Version)
+
+    def _load(self, Version):
+        try:
+            with self.path.open() as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        if not isinstance(data, dict) or data.get("format") != CACHE_FORMAT:
+            return
+
+        if data.get("fingerprint") != self.fingerprint:
+            return
+
+        for text, parts in data.get("tags", []):
+            tag = Tag(text)
+            self.tags.append(tag)
+            self._versions[tag.name] = Version(None, *parts) if parts else None
+
+        self.watermark = data.get("watermark")
+
+    def __contains__(self, name):
+        return name in self._versions
+
+    def __len__(self):
+        return len(self._versions)
+
+    def get(self, name):
+        """Return the :class:`~braulio.version.Version` of a tag, or **None**
+        if the tag didn't match the tag pattern. Raises :class:`KeyError`
+        if the tag is not cached."""
+
+        return self._versions[name]
+
+    def set(self, name, version):
+        self._versions[name] = version
+        self._modified = True
+
+    def save(self, tags, watermark):
+        """Write the cache file with the given tags, which must have been
+        analyzed with this cache. Entries of any other tag are dropped."""
+
+        if not self._modified and watermark == self.watermark:
+            return
+
+        entries = []
+
+        for tag in tags:
+            version = self._versions[tag.name]
+            entries.append([tag.text, list(version) if version else None])
+
+        data = {
+            "format": CACHE_FORMAT,
+            "fingerprint": self.fingerprint,
+            "watermark": watermark,
+            "tags": entries,
+        }
+
+        _write_json(self.path, data)
+        self.watermark = watermark
+        self._modified = False
+
+
+def _stages_fingerprint(tag_pattern, Version):
+    digest = hashlib.sha1(tag_pattern.encode())
+
+    for stage, (label, serializer) in Version.stages.items():
+        digest.update(f"\0{stage}\0{label}\0{serializer}".encode())
+
+    return digest.hexdigest()
+
+
+def _write_json(path, data):
+    """Write a JSON file atomically, through a temporary file."""
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+
+    with tmp_path.open("w") as f:
+        json.dump(data, f)
+
+    os.replace(str(tmp_path), str(path))
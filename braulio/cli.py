@@ -1,14 +1,24 @@
 import click
+from itertools import chain
 from pathlib import Path
 from click import style
-from braulio.git import Git, commit_analyzer, tag_analyzer
-from braulio.version import Version, get_next_version
+from braulio.git import Git, git_dir, commit_analyzer, tag_analyzer
+from braulio.cache import TagCache
+from braulio.version import Version, VersionIndex, get_next_version
 from braulio.config import Config, update_config_file
+from braulio.objects import (
+    CommitGraph,
+    ObjectStore,
+    commit_graph_is_stale,
+    refs_watermark,
+)
 from braulio.files import (
     find_chglog_file,
     create_chglog_file,
     update_chglog,
     update_files,
+    ChangelogIndex,
+    FileTransaction,
     ReleaseDataTree,
     DEFAULT_CHANGELOG,
 )
@@ -25,6 +35,19 @@ def msg(message, prefix=prefix_mark, suffix="", silence=False, nl=True):
         click.echo(f"{prefix}{message}{suffix}", nl=nl)
 
 
+class CountedIterable:
+    """Wrap an iterable counting the items consumed from it."""
+
+    def __init__(self, iterable):
+        self.count = 0
+        self._iterable = iterable
+
+    def __iter__(self):
+        for item in self._iterable:
+            self.count += 1
+            yield item
+
+
 def label(text):
     spaces = " " * (17 - len(text))
     return style(f"{text}{spaces}:", fg="blue", bold=True)
@@ -91,6 +114,41 @@ def init(changelog_name):
         update_config_file("changelog_file", changelog_name)
 
 
+@cli.command()
+@click.option(
+    "--force", is_flag=True, help="Write the commit-graph even if it is up to date."
+)
+def maintenance(force):
+    """Keep the repository fast to inspect.
+
+    Writes the commit-graph file of the repository if it is missing or
+    doesn't contain the current HEAD, so the history can be walked without
+    reading every commit object.
+    """
+
+    repository_dir = git_dir()
+
+    if repository_dir is None:
+        raise click.ClickException("Not a git repository.")
+
+    graph = CommitGraph.open(repository_dir)
+
+    try:
+        with ObjectStore(repository_dir) as store:
+            stale = commit_graph_is_stale(store, graph)
+    finally:
+        if graph is not None:
+            graph.close()
+
+    if not stale and not force:
+        msg("The commit-graph is up to date.")
+        return
+
+    msg("Write commit-graph ", nl=False)
+    Git().write_commit_graph()
+    msg(check_mark, prefix="")
+
+
 def bump_option_validator(ctx, param, value):
     """In case a value is provided checks that it is a valid version string. If
     is not thrown :class:`click.UsageError`.
@@ -155,6 +213,53 @@ def tag_pattern_option_validator(ctx, param, value):
     return value
 
 
+def _version_index(git, tag_pattern):
+    """Return the :class:`~braulio.version.VersionIndex` of the tags that
+    match ``tag_pattern``.
+
+    The versions are cached inside the .git directory. If no tag reference
+    changed since the last run, the tags aren't even listed, otherwise only
+    the new tags are analyzed.
+    """
+
+    repository_dir = git_dir()
+
+    if not repository_dir:
+        tags = git.version_tags(tag_pattern, Version)
+        versions = tag_analyzer(tags, tag_pattern, Version, batch=True)
+        return VersionIndex(versions, _newest_version(tags, versions))
+
+    tag_cache = TagCache(repository_dir / "braulio" / "tags.json", tag_pattern, Version)
+    watermark = refs_watermark(repository_dir)
+
+    # Without a watermark there is no way to tell if the tags changed
+    if watermark is not None and watermark == tag_cache.watermark:
+        tags = tag_cache.tags
+    else:
+        tags = git.version_tags(tag_pattern, Version)
+
+    versions = tag_analyzer(tags, tag_pattern, Version, cache=tag_cache, batch=True)
+    tag_cache.save(tags, watermark)
+
+    return VersionIndex(versions, _newest_version(tags, versions))
+
+
+def _newest_version(tags, versions):
+    """Return the version of the first tag in ``tags``, listed newest first,
+    that has one. The batch analysis sorts ``versions`` by number, so their
+    order can't tell which one is the newest."""
+
+    tag_versions = {version.tag.name: version for version in versions}
+
+    for tag in tags:
+        version = tag_versions.get(tag.name)
+
+        if version is not None:
+            return version
+
+    return None
+
+
 def current_version_option_validator(ctx, param, value):
     """If a version string is provided, validates it. Otherwise it tries
     to determine the current version from the last Git tag that matches
@@ -174,19 +279,20 @@ def current_version_option_validator(ctx, param, value):
     # Look for the last git tag for the curren version
     git = Git()
     tag_pattern = ctx.params["tag_pattern"]
-    versions = tag_analyzer(git.tags, tag_pattern, Version)
+
+    try:
+        version_index = _version_index(git, tag_pattern)
+    finally:
+        git.close()
 
     # User provided current version. Try to find a tag that match it.
     if current_version:
-        for version in versions:
-            if version == current_version:
-                current_version = version
-                break
-    elif versions:
-        current_version = versions[0]
+        current_version = version_index.get(current_version) or current_version
+    else:
+        current_version = version_index.newest()
 
     ctx.params["current_tag"] = current_version.tag if current_version else None
-    ctx.params["versions"] = versions
+    ctx.params["version_index"] = version_index
 
     return current_version
 
@@ -287,6 +393,13 @@ def stage_option_validator(ctx, param, value):
 @click.option(
     "--merge-pre", flag_value=True, default=False, help="Merge pre-release changelogs."
 )
+@click.option(
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Number of processes used to analyze commits and of threads used to"
+    " update files.",
+)
 @click.option(
     "-y", "confirm_flag", is_flag=True, default=False, help="Don't ask for confirmation"
 )
@@ -310,8 +423,9 @@ def release(
     current_version,
     stage,
     merge_pre,
+    jobs,
     current_tag=None,
-    versions=None,
+    version_index=None,
 ):
 
     """Release a new version.
@@ -323,6 +437,7 @@ def release(
     current_version = current_version or Version()
 
     git = Git()
+    ctx.call_on_close(git.close)
     from_tag = current_tag.name if current_tag else None
 
     # Delimiter of the block to be removed from the changelog file
@@ -332,25 +447,33 @@ def release(
     if merge_pre and current_version.stage != "final":
         remove_pre_chglog = [current_version.string]
 
-        for version in versions:
-            if version.stage == "final":
-                from_tag = version.tag.name
-                remove_pre_chglog.append(version.string)
-                break
+        previous_final = version_index.previous_final(current_version)
 
-    commit_list = git.log(_from=from_tag)
+        if previous_final is not None:
+            from_tag = previous_final.tag.name
+            remove_pre_chglog.append(previous_final.string)
 
-    msg(f'{label("Current version")} {current_version}')
-    msg(f'{label("Commits found")} {len(commit_list)} since last release')
+    # Commits are streamed from git-log and analyzed on the fly, so only
+    # the ones that match the label pattern are kept in memory.
+    commits = iter(git.iter_log(_from=from_tag))
+    first_commit = next(commits, None)
 
-    if not commit_list:
+    if first_commit is None:
+        msg(f'{label("Current version")} {current_version}')
+        msg(f'{label("Commits found")} 0 since last release')
         click.echo(" › Nothing to release.")
         ctx.exit()
 
-    semantic_commits = commit_analyzer(commit_list, label_pattern, label_position)
+    commits = CountedIterable(chain([first_commit], commits))
+    semantic_commits = commit_analyzer(
+        commits, label_pattern, label_position, workers=jobs
+    )
 
     release_data = ReleaseDataTree(semantic_commits)
 
+    msg(f'{label("Current version")} {current_version}')
+    msg(f'{label("Commits found")} {commits.count} since last release')
+
     bump_version_to = None
 
     # --bump, --major, --minor, --patch or commit message based version
@@ -391,23 +514,45 @@ def release(
 
     if confirm_flag or click.confirm(f"{prefix_mark}Continue?"):
 
-        msg("Update changelog ", nl=False)
-
-        update_chglog(
-            changelog_file,
-            new_version=new_version,
-            current_version=current_version,
-            release_data=release_data,
-            remove=remove_pre_chglog,
-        )
-
-        msg(check_mark, prefix="")
-
-        try:
-            update_files(files, str(current_version), str(new_version))
-        except ValueError as e:
-            click.echo(e)
-            ctx.abort()
+        # The offsets of the changelog sections are kept inside the .git
+        # directory, so the changelog isn't scanned on every release.
+        chglog_index = None
+        repository_dir = git_dir()
+
+        if repository_dir:
+            chglog_index_path = repository_dir / "braulio" / "changelog.json"
+            chglog_index = ChangelogIndex.open(changelog_file, chglog_index_path)
+
+        # The files are replaced only once all of them were updated
+        with FileTransaction() as transaction:
+            msg("Update changelog ", nl=False)
+
+            update_chglog(
+                changelog_file,
+                new_version=new_version,
+                current_version=current_version,
+                release_data=release_data,
+                remove=remove_pre_chglog,
+                transaction=transaction,
+                index=chglog_index,
+            )
+
+            msg(check_mark, prefix="")
+
+            try:
+                update_files(
+                    files,
+                    str(current_version),
+                    str(new_version),
+                    transaction=transaction,
+                    max_workers=jobs,
+                )
+            except ValueError as e:
+                click.echo(e)
+                ctx.abort()
+
+        if chglog_index is not None:
+            chglog_index.save(chglog_index_path)
 
         if commit_flag:
             message_args = {"new_version": new_version.string}
@@ -1,8 +1,19 @@
+import json
+import locale
+import mmap
+import os
 import re
+import shutil
+import tempfile
+import threading
 import click
-from collections import UserDict
+from collections import OrderedDict, UserDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import date
 from pathlib import Path
+from braulio.cache import _write_json
+from braulio.version import validate_version_str
 
 
 KNOWN_CHANGELOG_FILES = ("HISTORY.rst", "CHANGELOG.rst", "CHANGES.rst")
@@ -148,6 +159,113 @@ def is_title(first, second, third):
     return False
 
 
+# A line of adornment characters, which may be the underline of a title.
+# Its line break is only looked ahead, since it also ends the line before
+# the next adornment line.
+_underline_regexp = re.compile(rb"\n([-=~*`']+)(?=(\r?\n|\Z))")
+
+
+def find_titles(buffer):
+    """Yield a ``(start, end, title)`` tuple for each title of a RST buffer,
+    which can be a :class:`mmap.mmap`, with a single regex search over it.
+
+    ``title`` is the text line of the title, as bytes. ``start`` is its
+    offset, or the one of its overline if it has one, and ``end`` is the
+    offset after the underline. Titles are checked as :func:`is_title` does
+    when it gets the title line as its second argument.
+    """
+
+    for match in _underline_regexp.finditer(buffer):
+        title_end = match.start()
+        start = buffer.rfind(b"\n", 0, title_end) + 1
+        title = buffer[start:title_end].rstrip(b"\r")
+        underline, underline_break = match.groups()
+
+        # Line lengths include the line break, as in is_title, which gets
+        # the lines with universal newlines
+        if not title or len(title) + 1 != len(underline) + bool(underline_break):
+            continue
+
+        end = match.end() + len(underline_break)
+
+        # The line before the first one is taken as a blank line
+        if start == 0:
+            yield start, end, title
+            continue
+
+        prev_start = buffer.rfind(b"\n", 0, start - 1) + 1
+        prev_line = buffer[prev_start:start].rstrip(b"\r\n")
+
+        if not prev_line:
+            yield start, end, title
+        elif prev_line == underline and underline_break:
+            yield prev_start, end, title
+
+
+@contextmanager
+def _mapped(path, min_size=1):
+    """Memory map a file for reading. Files smaller than ``min_size`` are
+    read instead, empty ones always since they can't be mapped."""
+
+    with Path(path).open("rb") as f:
+        if os.fstat(f.fileno()).st_size < max(min_size, 1):
+            yield f.read()
+            return
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield mm
+
+
+def _decode(data):
+    """Decode bytes read from a file as open() does in text mode."""
+
+    text = data.decode(_encoding())
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+
+def _encoding():
+    # The one used by open() in text mode
+    return locale.getpreferredencoding(False)
+
+
+def _copy_until_title(src, dst, title):
+    """Copy the lines of ``src`` to ``dst`` up to the section with the given
+    title. Return the lines already read from ``src`` that belong to the
+    section, or **None** if the title is not found, in which case the whole
+    ``src`` is copied.
+    """
+
+    # The line before the first one is taken as a blank line
+    prev_line = None
+    curr_line = src.readline()
+
+    while curr_line:
+        next_line = src.readline()
+
+        if title in curr_line and is_title(
+            "\n" if prev_line is None else prev_line, curr_line, next_line or None
+        ):
+            section = [curr_line, next_line]
+
+            # The title has an overline
+            if prev_line not in (None, "\n"):
+                section.insert(0, prev_line)
+            elif prev_line is not None:
+                dst.write(prev_line)
+
+            return section
+
+        if prev_line is not None:
+            dst.write(prev_line)
+
+        prev_line, curr_line = curr_line, next_line
+
+    if prev_line is not None:
+        dst.write(prev_line)
+
+    return None
+
+
 def _split_chglog(path, title):
     """Split a RST file text in two parts. The title argument determine the
     split point. The given title goes in the bottom part. If the title is not
@@ -156,77 +274,703 @@ def _split_chglog(path, title):
     Return a tuple with the top and bottom parts.
     """
 
-    with path.open() as f:
-        doc = f.readlines()
+    with _mapped(path) as buffer:
+        split = len(buffer)
+
+        for start, _, text in find_titles(buffer):
+            if title in _decode(text):
+                split = start
+                break
 
-    has_title = False
+        return _decode(buffer[:split]), _decode(buffer[split:])
 
-    for idx, curr_line in enumerate(doc):
 
-        if title in curr_line:
-            prev_line = doc[idx - 1] if idx - 1 < len(doc) else "\n"
-            next_line = doc[idx + 1] if idx + 1 < len(doc) else None
+class _BlockRemover:
+    """Write to a file dropping the lines from the first one that starts with
+    ``start`` up to the first one after it that starts with ``end``, which is
+    kept. Without ``end`` everything after ``start`` is dropped.
 
-            if is_title(prev_line, curr_line, next_line):
-                idx = idx if prev_line == "\n" else idx - 1
-                has_title = True
-                break
+    Once the block is over, text is written straight to the file.
+    """
+
+    def __init__(self, f, start, end=None):
+        self.file = f
+        self.start = start
+        self.end = end
+        self.skip = False
+        self.done = False
+
+    def write(self, text):
+        if self.done:
+            self.file.write(text)
+            return
+
+        for line in text.splitlines(keepends=True):
+            if self.done:
+                self.file.write(line)
+                continue
+
+            self.skip = self.skip or line.startswith(self.start)
+
+            if self.skip:
+                if self.end is None or not line.startswith(self.end):
+                    continue
+
+                self.skip = False
+                self.done = True
+
+            self.file.write(line)
+
+
+class FileTransaction:
+    """Group the file rewrites of a release, so they are applied all
+    together or not at all.
+
+    Each rewrite goes to a temporary file next to its target. On
+    :meth:`commit` the temporary files, already synced to disk, are renamed
+    over their targets. If a rename fails, the targets already replaced are
+    restored from hard links to their original content.
+
+    Symbolic links are resolved first, so the file they point to is the one
+    rewritten and the links are kept.
+
+    As a context manager, it commits on success and rolls back on error.
+    """
+
+    def __init__(self):
+        # Target path -> path of its new content
+        self._staged = OrderedDict()
+        # Different files can be rewritten from many threads
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+
+    def __contains__(self, path):
+        """Whether ``path`` was already rewritten in this transaction."""
+
+        return _real_path(path) in self._staged
+
+    def source(self, path):
+        """Return the path of the current content of ``path``, including
+        the rewrites made in this transaction."""
+
+        path = _real_path(path)
+        return self._staged.get(path, path)
+
+    @contextmanager
+    def rewrite(self, path, binary=False, newline=None):
+        """Return a context manager that gives a ``(src, dst)`` pair of open
+        files: the current content of ``path``, including the rewrites made
+        in this transaction, and a temporary file for the new content.
+
+        Both files are opened in binary mode if ``binary`` is set. Otherwise
+        ``newline`` is the line break written for each ``"\\n"``, as in
+        :func:`open`.
+        """
+
+        path = _real_path(path)
+        source = self.source(path)
+        mode = "b" if binary else ""
+        tmp = tempfile.NamedTemporaryFile(
+            "w" + mode,
+            dir=str(path.parent),
+            prefix=f".{path.name}.",
+            delete=False,
+            newline=None if binary else newline,
+        )
+
+        try:
+            with source.open("r" + mode) as src, tmp:
+                yield src, tmp
+
+                tmp.flush()
+                os.fsync(tmp.fileno())
+
+            shutil.copymode(str(path), tmp.name)
+        except BaseException:
+            os.unlink(tmp.name)
+            raise
+
+        with self._lock:
+            if path in self._staged:
+                os.unlink(str(self._staged[path]))
+
+            self._staged[path] = Path(tmp.name)
+
+    def commit(self):
+        originals = []
+
+        try:
+            for path, tmp in self._staged.items():
+                original = tmp.with_name(tmp.name + ".orig")
+
+                try:
+                    os.link(str(path), str(original))
+                except OSError:
+                    # The file system doesn't support hard links
+                    shutil.copy2(str(path), str(original))
+
+                try:
+                    os.replace(str(tmp), str(path))
+                except BaseException:
+                    os.unlink(str(original))
+                    raise
+
+                originals.append((path, original))
+        except BaseException:
+            for path, original in reversed(originals):
+                os.replace(str(original), str(path))
+
+            self.rollback()
+            raise
+
+        for path, original in originals:
+            os.unlink(str(original))
+
+        for directory in {path.parent for path in self._staged}:
+            _fsync_dir(directory)
+
+        self._staged.clear()
+
+    def rollback(self):
+        for tmp in self._staged.values():
+            if tmp.exists():
+                os.unlink(str(tmp))
+
+        self._staged.clear()
+
+
+def _real_path(path):
+    """Return ``path`` with its symbolic links resolved, even if it doesn't
+    exist."""
+
+    return Path(os.path.realpath(str(path)))
+
+
+def _fsync_dir(path):
+    """Make the renames in a directory durable, where it is supported."""
+
+    try:
+        fd = os.open(str(path), os.O_RDONLY)
+    except OSError:
+        return
+
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def _transaction(transaction):
+    """Use the given transaction, or a new one committed at the end."""
+
+    if transaction is not None:
+        yield transaction
+        return
+
+    with FileTransaction() as transaction:
+        yield transaction
+
+
+# Bump it every time the format of the index files changes
+CHANGELOG_INDEX_FORMAT = 1
+
+
+class ChangelogIndex:
+    """Byte offsets of the release sections of a changelog file, so a
+    section can be reached without scanning the file line by line.
+
+    Sections are found by their title, which must start with a version
+    string, and go up to the next one. The offset of a section is the one of
+    its title, or of its overline if it has one.
+
+    The index is valid while the file keeps the size and modification time
+    it had when it was built. It can be stored in a sidecar file with
+    :meth:`save` and read back with :meth:`load`.
+    """
+
+    def __init__(self, path, sections, size, mtime_ns):
+        self.path = Path(path)
+        # (version string, offset) pairs, in the order of the file
+        self.sections = list(sections)
+        self.size = size
+        self.mtime_ns = mtime_ns
+
+        self._reindex()
+
+    def _reindex(self):
+        # If a version has many sections, the first one wins, as in a scan
+        self._positions = {}
+
+        for i, (version, _) in enumerate(self.sections):
+            self._positions.setdefault(version, i)
+
+    @classmethod
+    def build(cls, path):
+        """Scan the changelog file to build its index."""
+
+        path = Path(path)
+
+        with _mapped(path) as buffer:
+            stat = path.stat()
+            sections = list(_version_sections(buffer))
+
+        return cls(path, sections, stat.st_size, stat.st_mtime_ns)
+
+    @classmethod
+    def load(cls, path, index_path):
+        """Read an index stored with :meth:`save`. Return **None** if there
+        is none, or if it is no longer valid."""
+
+        try:
+            with index_path.open() as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if not isinstance(data, dict):
+            return None
+
+        if data.get("format") != CHANGELOG_INDEX_FORMAT:
+            return None
+
+        if data.get("path") != str(Path(path).resolve()):
+            return None
 
-    if has_title:
-        top, bottom = doc[:idx], doc[idx:]
+        index = cls(
+            path,
+            [tuple(section) for section in data.get("sections", [])],
+            data.get("size"),
+            data.get("mtime_ns"),
+        )
+
+        return index if index.is_valid() else None
+
+    @classmethod
+    def open(cls, path, index_path=None):
+        """Return the index stored at ``index_path`` if it is valid, or a
+        new one. Return **None** if the changelog file doesn't exist."""
+
+        if index_path is not None:
+            index = cls.load(path, index_path)
+
+            if index is not None:
+                return index
+
+        try:
+            return cls.build(path)
+        except OSError:
+            return None
+
+    def is_valid(self):
+        """Whether the file is still the one the index was built from."""
+
+        try:
+            stat = self.path.stat()
+        except OSError:
+            return False
+
+        return (stat.st_size, stat.st_mtime_ns) == (self.size, self.mtime_ns)
+
+    def __contains__(self, version):
+        return version in self._positions
+
+    def __len__(self):
+        return len(self.sections)
+
+    def section(self, version):
+        """Return the ``(offset, length)`` of the section of ``version``.
+        Raises :class:`KeyError` if there is no such section."""
+
+        i = self._positions[version]
+        offset = self.sections[i][1]
+
+        if i + 1 < len(self.sections):
+            end = self.sections[i + 1][1]
+        else:
+            end = self.size
+
+        return offset, end - offset
+
+    def read_section(self, version):
+        """Return the text of the section of ``version``, title included."""
+
+        offset, length = self.section(version)
+
+        with _mapped(self.path) as buffer:
+            return _decode(buffer[offset:offset + length])
+
+    def save(self, index_path):
+        """Store the index, only if it matches the current file."""
+
+        stat = self.path.stat()
+
+        if stat.st_size != self.size:
+            return
+
+        # After an update, the modification time is only known once the
+        # file is replaced
+        if self.mtime_ns not in (None, stat.st_mtime_ns):
+            return
+
+        self.mtime_ns = stat.st_mtime_ns
+
+        data = {
+            "format": CHANGELOG_INDEX_FORMAT,
+            "path": str(self.path.resolve()),
+            "size": self.size,
+            "mtime_ns": self.mtime_ns,
+            "sections": [list(section) for section in self.sections],
+        }
+
+        _write_json(index_path, data)
+
+    def _insert(self, version, offset, length, removed=None):
+        """Update the index after a section of ``length`` bytes is inserted
+        at ``offset``, and the ``(start, end)`` range of bytes after it,
+        which comes from the original file, is removed."""
+
+        start, end = removed or (offset, offset)
+        delta = length - (end - start)
+
+        sections = [section for section in self.sections if section[1] < offset]
+        sections.append((version, offset))
+
+        # Sections in the removed range are dropped
+        for section_version, section_offset in self.sections:
+            if offset <= section_offset < start:
+                sections.append((section_version, section_offset + length))
+            elif section_offset >= end:
+                sections.append((section_version, section_offset + delta))
+
+        self.sections = sections
+        self.size += delta
+        self.mtime_ns = None
+
+        self._reindex()
+
+    def _discard(self):
+        """Mark the index as outdated, so it is never saved."""
+
+        self.size = None
+
+
+def _version_sections(buffer):
+    """Yield the ``(version, offset)`` of each section of a changelog buffer
+    whose title starts with a version string."""
+
+    encoding = _encoding()
+
+    for start, _, title in find_titles(buffer):
+        if not title[:1].isdigit():
+            continue
+
+        version = title.split(None, 1)[0].decode(encoding, errors="replace")
+
+        if validate_version_str(version):
+            yield version, start
+
+
+def _locate_sections(sections, size, current, remove=None):
+    """Return the offset of the section of ``current``, and the ``(start,
+    end)`` range of bytes to drop for ``remove``, from ``(version, offset)``
+    pairs in the order of the file. Only the pairs up to the last needed
+    section are consumed.
+
+    Return **None** if any of the sections is missing.
+    """
+
+    wanted = {current, *(remove or ())}
+    offsets = {}
+
+    for version, offset in sections:
+        if version in wanted:
+            offsets.setdefault(version, offset)
+
+            if len(offsets) == len(wanted):
+                break
     else:
-        top, bottom = doc, []
+        return None
+
+    start = offsets[current]
+
+    if not remove:
+        return start, (start, start)
 
-    return "".join(top), "".join(bottom)
+    removed = offsets[remove[0]], offsets[remove[1]] if len(remove) > 1 else size
 
+    if not start <= removed[0] <= removed[1]:
+        return None
+
+    return start, removed
+
+
+def update_chglog(
+    path,
+    current_version,
+    new_version,
+    release_data,
+    remove=None,
+    transaction=None,
+    index=None,
+):
+    """Insert the section of the new release before the one of the current
+    version.
+
+    If ``remove`` is given, the lines from the one starting with
+    ``remove[0]`` up to the one starting with ``remove[1]`` are dropped, to
+    merge the pre-release sections into the new one.
+
+    The file is rewritten in a single pass, so it is never loaded in memory
+    as a whole. The rewrite is part of ``transaction`` if given, see
+    :class:`FileTransaction`.
+
+    The sections are looked up in ``index`` if it is a valid
+    :class:`ChangelogIndex` of the file, which is then updated, or found
+    with :func:`find_titles`. The bytes around them are copied through
+    ``mmap``. If they aren't titles, the file is rewritten line by line and
+    the index is discarded. Either way, the file keeps the line break of its
+    first line, see :func:`_newline`.
+    """
 
-def update_chglog(path, current_version, new_version, release_data, remove=None):
-    top, bottom = _split_chglog(path, title=current_version.string)
     markup = _render_release(new_version, release_data)
 
-    path.write_text(top + markup + bottom)
+    with _transaction(transaction) as t:
+        # Offsets are only known for the file on disk
+        if path not in t and _insert_section(
+            t, path, index, current_version, new_version, markup, remove
+        ):
+            return
+
+        if index is not None:
+            index._discard()
+
+        with t.rewrite(path, newline=_newline(t.source(path))) as (src, tmp):
+            dst = _BlockRemover(tmp, *remove[:2]) if remove else tmp
+
+            section = _copy_until_title(src, dst, current_version.string)
+            dst.write(markup)
+
+            for line in section or []:
+                dst.write(line)
+
+            # Lines are only checked until the removed block is over
+            if remove:
+                for line in src:
+                    dst.write(line)
+
+                    if dst.done:
+                        break
 
-    if remove:
-        text = ""
-        skip = False
+            shutil.copyfileobj(src, tmp)
 
-        with path.open() as f:
-            for line in f:
-                skip = skip or line.startswith(remove[0])
 
-                if skip:
-                    if line.startswith(remove[1]):
-                        skip = False
-                    else:
-                        continue
+def _newline(path):
+    """Return ``"\\r\\n"`` if the first line of ``path`` ends with it, or
+    **None**. Changelogs are updated with the line break of their first line
+    on every path, so a CRLF file stays CRLF."""
+
+    with open(str(path), "rb") as f:
+        return "\r\n" if f.readline().endswith(b"\r\n") else None
+
+
+def _insert_section(
+    transaction, path, index, current_version, new_version, markup, remove
+):
+    """Rewrite the changelog at the offsets of its sections. Return
+    **False**, without touching the file, if any of them is missing."""
+
+    use_index = index is not None and index.is_valid()
+
+    with _mapped(path) as buffer:
+        if use_index:
+            sections = iter(index.sections)
+        else:
+            sections = _version_sections(buffer)
+
+        located = _locate_sections(
+            sections, len(buffer), current_version.string, remove
+        )
 
-                text += line
+        if not use_index:
+            # A scan stopped early still holds the buffer
+            sections.close()
 
-        path.write_text(text)
+        if located is None:
+            return False
+
+        start, removed = located
+
+        # Keep the line breaks of the file
+        if _newline(path) == "\r\n":
+            markup = markup.replace("\n", "\r\n")
+
+        data = markup.encode(_encoding())
+
+        with transaction.rewrite(path, binary=True) as (_, dst):
+            with memoryview(buffer) as view:
+                dst.write(view[:start])
+                dst.write(data)
+                dst.write(view[start:removed[0]])
+                dst.write(view[removed[1]:])
+
+    if use_index:
+        index._insert(new_version.string, start, len(data), removed)
+    elif index is not None:
+        index._discard()
+
+    return True
 
 
 version_pattern = re.compile("_?_?version_?_?\s?=\s?(?:'|\")")
 
 
-def update_files(paths, current_version, new_version):
+# Same as version_pattern, searched in the whole content of a file, so
+# white space can't span lines. The optional underscores before "version"
+# don't change which lines match, so they are left out.
+_version_assignment_regexp = re.compile(rb"version_?_?[^\S\r\n]?=[^\S\r\n]?['\"]")
+
+# Files at least this big are memory mapped instead of read
+MMAP_THRESHOLD = 1024 * 1024
+
+# Result of updating the version strings of a file. ``count`` is the number
+# of lines updated and ``error`` the exception raised, if any.
+FileUpdate = namedtuple("FileUpdate", ["path", "count", "error"])
+
+
+def _version_lines(buffer, version):
+    """Yield the ``(start, end)`` span of each line of ``buffer`` with a
+    version string assignment that contains ``version``."""
+
+    search = _version_assignment_regexp.search
+    match = search(buffer)
+
+    while match:
+        start = buffer.rfind(b"\n", 0, match.start()) + 1
+        end = buffer.find(b"\n", match.end())
+        end = len(buffer) if end == -1 else end
+
+        if buffer.find(version, start, end) != -1:
+            yield start, end
+
+        match = search(buffer, end)
+
+
+def _update_version_file(transaction, path, current_version, new_version):
+    """Replace the version in the version strings of a file, as part of
+    ``transaction``. Return the number of lines updated."""
+
+    current, new = current_version.encode(), new_version.encode()
+
+    with _mapped(transaction.source(path), MMAP_THRESHOLD) as buffer:
+        # Most files without the version are discarded here
+        if buffer.find(current) == -1:
+            return 0
+
+        spans = list(_version_lines(buffer, current))
+
+        if not spans:
+            return 0
+
+        with transaction.rewrite(path, binary=True) as (_, dst):
+            with memoryview(buffer) as view:
+                position = 0
+
+                for start, end in spans:
+                    dst.write(view[position:start])
+                    dst.write(bytes(view[start:end]).replace(current, new))
+                    position = end
+
+                dst.write(view[position:])
+
+    return len(spans)
+
+
+def update_version_files(
+    paths, current_version, new_version, transaction, workers=None
+):
+    """Replace the current version with the new one in the version strings
+    of the given files, as part of ``transaction``, see
+    :class:`FileTransaction`.
+
+    Each file is searched with a single regex over its whole content, which
+    is memory mapped for big files. Files that don't contain the current
+    version at all are skipped without running it. If ``workers`` is
+    greater than one, files are updated in a pool of that many threads.
+
+    Return a :class:`FileUpdate` for each path, in the same order. Errors
+    are reported there instead of being raised.
+    """
+
+    def update(path):
+        try:
+            count = _update_version_file(
+                transaction, path, current_version, new_version
+            )
+        except Exception as e:
+            return FileUpdate(path, 0, e)
+
+        return FileUpdate(path, count, None)
+
+    # The same file can't be rewritten from two threads at once
+    path_list = list(OrderedDict.fromkeys(Path(p) for p in paths))
+
+    if workers and workers > 1 and len(path_list) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(update, path_list))
+
+    return [update(path) for path in path_list]
+
+
+def update_files(
+    paths, current_version, new_version, transaction=None, max_workers=None
+):
+    """Replace the current version with the new one in the version strings
+    of the given files. Raise :class:`ValueError` if a file doesn't have
+    one, in which case none of the files is updated.
+
+    The rewrites are part of ``transaction`` if given, see
+    :class:`FileTransaction`. With ``max_workers`` greater than one, the
+    files are updated in a pool of that many threads.
+
+    Errors don't depend on the order in which files are done: the first
+    error raised by a file, in the order of ``paths``, is raised again.
+    Otherwise, a single :class:`ValueError` names all the files without a
+    version string. Return the report of :func:`update_version_files`.
+    """
+
     path_list = [Path(p) for p in paths]
 
     for path in path_list:
         if not path.is_file():
             click.echo(f"The file {path} is invalid or does not exist")
 
-        text = ""
-        string_found = False
+    with _transaction(transaction) as t:
+        report = update_version_files(
+            path_list, current_version, new_version, t, workers=max_workers
+        )
 
-        with path.open() as f:
-            for line in f:
-                if version_pattern.search(line) and current_version in line:
-                    line = line.replace(current_version, new_version)
-                    string_found = True
+        for update in report:
+            if update.error is not None:
+                raise update.error
 
-                text += line
+        missing = [
+            f'Unable to find a version string to update in "{update.path}"'
+            for update in report
+            if not update.count
+        ]
 
-        if not string_found:
-            raise ValueError(f'Unable to find a version string to update in "{path}"')
+        if missing:
+            raise ValueError("\n".join(missing))
 
-        path.write_text(text)
+    return report
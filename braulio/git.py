@@ -1,7 +1,13 @@
 import re
+import tempfile
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import chain, islice, repeat
+from operator import attrgetter
 from pathlib import Path
 from typing import NamedTuple
-from subprocess import run, PIPE, CalledProcessError
+from subprocess import run, Popen, PIPE, CalledProcessError
 
 hash_pattern = re.compile("(?<=commit )\w{40}$", re.M)
 
@@ -11,6 +17,53 @@ def _run_command(command):
     return captured.stdout.decode()
 
 
+def _stream_command(command, separator=b"\n", chunk_size=65536):
+    """Run a command yielding its standard output record by record, instead
+    of buffering the whole output in memory. Records are delimited by
+    ``separator``, which is not included in the yielded strings.
+
+    If the command exits with a non-zero code,
+    :class:`~subprocess.CalledProcessError` is raised once the output is
+    exhausted.
+
+    The standard error goes to a temporary file. If it were a pipe read at
+    the end, a command writing a lot of warnings would block on it while
+    its standard output is being read.
+    """
+
+    with tempfile.TemporaryFile() as stderr_file, Popen(
+        command, stdout=PIPE, stderr=stderr_file
+    ) as process:
+        remainder = b""
+
+        for chunk in iter(lambda: process.stdout.read(chunk_size), b""):
+            records = (remainder + chunk).split(separator)
+            remainder = records.pop()
+
+            for record in records:
+                yield record.decode()
+
+        if remainder:
+            yield remainder.decode()
+
+        if process.wait():
+            stderr_file.seek(0)
+            stderr = stderr_file.read()
+            raise CalledProcessError(process.returncode, command, stderr=stderr)
+
+
+def git_dir():
+    """Return the path of the .git directory of the repository in the
+    current working directory, or **None** if there isn't a repository."""
+
+    try:
+        path = _run_command(["git", "rev-parse", "--absolute-git-dir"])
+    except (CalledProcessError, OSError):
+        return None
+
+    return Path(path.strip())
+
+
 def _run_git_tag_command():
     command = [
         "git",
@@ -22,10 +75,23 @@ def _run_git_tag_command():
 
 
 class Tag:
+    """A tag as printed by ``git tag --format=%(creatordate:short)%09...``.
+
+    Only the text is stored, the date and name are sliced from it on access.
+    """
+
+    __slots__ = ("text",)
+
     def __init__(self, text):
         self.text = text
-        self.date = text[:10]
-        self.name = text[10:].strip()
+
+    @property
+    def date(self):
+        return self.text[:10]
+
+    @property
+    def name(self):
+        return self.text[10:].strip()
 
     def __str__(self):
         return self.name
@@ -35,26 +101,62 @@ class Tag:
 
 
 class Commit:
+    """A commit parsed from the git-log output.
+
+    Only the hash and the message are stored. The header, footer and body
+    are sliced from the message on access.
+    """
+
+    __slots__ = ("hash", "message")
+
     def __init__(self, text):
-        self.text = text
         lines = text.strip().split("\n")
 
         # Commit hash
         self.hash = lines[0][7:]
 
         # Commit message
-        msg_lines = [line[4:] for line in lines[4:]]
-        self.message = "\n".join(msg_lines)
+        self.message = "\n".join([line[4:] for line in lines[4:]])
 
-        # Commit message header
-        self.header = msg_lines[0]
-        self.footer = msg_lines[-1]
+    @classmethod
+    def from_fields(cls, commit_hash, message):
+        """Create a commit from its hash and raw message, as they are printed
+        by ``git log --format=%H%x00%B``."""
 
-        # Commit message body
-        self.body = None
+        commit = cls.__new__(cls)
+        commit.hash = commit_hash
+        commit.message = message.rstrip()
 
-        if len(msg_lines) > 2 and msg_lines[1] == "":
-            self.body = "\n".join(msg_lines[2:])
+        return commit
+
+    @property
+    def header(self):
+        """First line of the message."""
+
+        end = self.message.find("\n")
+        return self.message if end == -1 else self.message[:end]
+
+    @property
+    def footer(self):
+        """Last line of the message."""
+
+        start = self.message.rfind("\n") + 1
+        return self.message[start:]
+
+    @property
+    def body(self):
+        """Everything after the header and the blank line that follows it, or
+        **None** if the header isn't followed by a blank line."""
+
+        message = self.message
+        start = message.find("\n\n")
+
+        # The blank line must be the second one
+        if start == -1 or start != message.find("\n"):
+            return None
+
+        start += 2
+        return message[start:]
 
     def __repr__(self):
         return f"Commit('{self.header}')"
@@ -67,7 +169,179 @@ def _extract_commit_texts(git_log_text):
     return re.findall(patter, git_log_text)
 
 
+def _log_command(_from=None, to=None):
+    command = ["git", "log"]
+
+    if _from:
+        to = "HEAD" if not to else to
+        revision_range = f"{_from}..{to}"
+        command.append(revision_range)
+
+    return command
+
+
+# Machine readable git-log format. Each commit is printed as two NUL
+# terminated fields, the commit hash and the raw commit message.
+log_format = ["-z", "--format=%H%x00%B"]
+
+
+class GitSession:
+    """Long-lived ``git cat-file --batch-check`` and ``git cat-file --batch``
+    processes, used to resolve revisions and read objects through their pipes
+    instead of spawning a new git process for each lookup.
+
+    Processes are started on the first lookup that needs them. Use it as a
+    context manager, or call :meth:`close`, to terminate them.
+    """
+
+    def __init__(self):
+        self._processes = {}
+
+    def _process(self, option):
+        process = self._processes.get(option)
+
+        if process is None:
+            command = ["git", "cat-file", option]
+            process = Popen(command, stdin=PIPE, stdout=PIPE, stderr=PIPE)
+            self._processes[option] = process
+
+        return process
+
+    def _request(self, option, rev):
+        process = self._process(option)
+        process.stdin.write(rev.encode() + b"\n")
+        process.stdin.flush()
+
+        header = process.stdout.readline()
+
+        if not header:
+            command = ["git", "cat-file", option]
+            stderr = process.stderr.read()
+            raise CalledProcessError(process.wait(), command, stderr=stderr)
+
+        fields = header.split()
+
+        # "<rev> missing" or "<rev> ambiguous"
+        if len(fields) != 3:
+            return process, None
+
+        return process, (fields[0].decode(), fields[1].decode(), int(fields[2]))
+
+    def resolve(self, rev):
+        """Return a ``(hash, type, size)`` tuple for the object named by
+        ``rev``, or **None** if it doesn't exist."""
+
+        return self._request("--batch-check", rev)[1]
+
+    def read_object(self, rev):
+        """Return a ``(hash, type, data)`` tuple for the object named by
+        ``rev``, where data is the raw content as bytes, or **None** if the
+        object doesn't exist."""
+
+        process, info = self._request("--batch", rev)
+
+        if info is None:
+            return None
+
+        object_hash, object_type, size = info
+        data = process.stdout.read(size)
+
+        # Contents are followed by a line feed
+        process.stdout.read(1)
+
+        return object_hash, object_type, data
+
+    def close(self):
+        for process in self._processes.values():
+            process.stdin.close()
+            process.wait()
+            process.stdout.close()
+            process.stderr.close()
+
+        self._processes = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _parse_tag_list(command_output):
+    """Return a list of :class:`Tag` from the git-tag output, newest first."""
+
+    command_output = command_output.strip()
+
+    if command_output == "":
+        return []
+
+    tag_text_list = command_output.split("\n")
+    tag_list = [Tag(text) for text in tag_text_list]
+
+    return list(reversed(tag_list))
+
+
+def _split_commit_object(data):
+    """Split a raw commit object in its headers and message."""
+
+    headers, _, message = data.decode().partition("\n\n")
+    return headers, message
+
+
 class Git:
+    """Run git commands in the repository of the current working directory.
+
+    Lookups of single objects go through a :class:`GitSession`, which is
+    closed when the instance is used as a context manager.
+
+    With ``backend="objects"``, the log is read straight from the object
+    database by :mod:`braulio.objects`, without running git.
+    """
+
+    def __init__(self, session=None, backend="git"):
+        if backend not in {"git", "objects"}:
+            raise ValueError(f"Unknown backend {backend}")
+
+        self._session = session
+        self.backend = backend
+
+    @property
+    def session(self):
+        if self._session is None:
+            self._session = GitSession()
+        return self._session
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def rev_parse(self, rev):
+        """Return the hash of the object named by ``rev``, or **None** if it
+        doesn't exist."""
+
+        info = self.session.resolve(rev)
+        return info[0] if info else None
+
+    def read_commit(self, rev):
+        """Return the :class:`Commit` named by ``rev``, or **None** if there
+        isn't a commit with that name."""
+
+        obj = self.session.read_object(f"{rev}^{{commit}}")
+
+        if obj is None:
+            return None
+
+        commit_hash, _, data = obj
+        headers, message = _split_commit_object(data)
+
+        return Commit.from_fields(commit_hash, message)
+
     def add(self, *files):
         """Add one or more files to the index running git-add."""
 
@@ -92,18 +366,71 @@ class Git:
     def log(self, _from=None, to=None):
         """Run git-log."""
 
-        command = ["git", "log"]
-
-        if _from:
-            to = "HEAD" if not to else to
-            revision_range = f"{_from}..{to}"
-            command.append(revision_range)
-
+        command = _log_command(_from, to)
         git_log_text = _run_command(command)
         commit_text_lst = _extract_commit_texts(git_log_text)
 
         return [Commit(commit_text) for commit_text in commit_text_lst]
 
+    def iter_log(self, _from=None, to=None):
+        """Run git-log yielding :class:`Commit` objects as they are read
+        from the command output, so the whole log is never held in memory.
+
+        The log is requested in a NUL delimited format, so commits are split
+        without any regular expression. The ``objects`` backend only keeps
+        the hashes and parents of the commits in the range during the walk,
+        see :func:`braulio.objects.walk_commits`.
+        """
+
+        if self.backend == "objects":
+            yield from self._walk_log(_from, to)
+            return
+
+        yield from self._stream_log(_from, to)
+
+    def _stream_log(self, _from=None, to=None):
+        command = _log_command(_from, to) + log_format
+        fields = _stream_command(command, separator=b"\0")
+
+        # Fields come in (hash, message) pairs
+        for commit_hash, message in zip(fields, fields):
+            yield Commit.from_fields(commit_hash, message)
+
+    def _walk_log(self, _from=None, to=None):
+        from braulio.objects import (
+            CommitGraph,
+            ObjectStore,
+            find_git_dir,
+            walk_commits,
+        )
+
+        path = find_git_dir()
+
+        if path is None:
+            raise FileNotFoundError("Not a git repository")
+
+        head = to if _from and to else "HEAD"
+
+        with ObjectStore(path, session=self.session) as store:
+            # The references of reftable repositories can't be read
+            if not store.has_ref_storage:
+                yield from self._stream_log(_from, to)
+                return
+
+            graph = CommitGraph.open(path)
+
+            try:
+                yield from walk_commits(store, head, _from, graph=graph)
+            finally:
+                if graph is not None:
+                    graph.close()
+
+    def write_commit_graph(self):
+        """Write the commit-graph file of the repository running
+        git-commit-graph."""
+
+        return _run_command(["git", "commit-graph", "write", "--reachable"])
+
     def tag(self, name=None):
         """Create and list tag objects running git-tag command"""
 
@@ -118,15 +445,7 @@ class Git:
                 ]
             )
 
-            command_output = _run_command(command).strip()
-
-            if command_output == "":
-                return []
-
-            tag_text_list = command_output.split("\n")
-            tag_list = [Tag(text) for text in tag_text_list]
-
-            return list(reversed(tag_list))
+            return _parse_tag_list(_run_command(command))
 
         command.extend(["-a", name, "-m", '""'])
         return _run_command(command)
@@ -137,15 +456,237 @@ class Git:
             self._tag_list = self.tag()
         return self._tag_list
 
+    def version_tags(self, tag_pattern, Version):
+        """Return the tags whose name matches ``tag_pattern``, newest first.
+
+        The tag references are read from the git directory, so only the
+        dates of the matching tags are resolved. The tag and commit objects
+        that aren't in the object directories are read through
+        :attr:`session`. If the repository can't be read that way, like
+        reftable repositories, the tags listed by git-tag are filtered
+        instead.
+        """
+
+        from braulio.objects import ObjectStore, find_git_dir
+
+        match = _tag_regexp(tag_pattern, Version).match
+        path = find_git_dir()
+
+        if path is not None:
+            try:
+                with ObjectStore(path, session=self.session) as store:
+                    if store.has_ref_storage:
+                        return store.tags(match)
+            except (KeyError, ValueError, OSError):
+                pass
+
+        return [tag for tag in self.tags if match(tag.name)]
+
 
 class SemanticCommit(NamedTuple):
     subject: str
     message: str
     type: str
     scope: str
+    convention: str = None
+
+
+def _label_regexp(label_pattern, label_position, prefix):
+    """Translate a label pattern into a regular expression pattern, where
+    the names of the capturing groups start with ``prefix``."""
+
+    pattern_string = re.escape(label_pattern)
+
+    # Capturing group patterns
+    action_cgp = rf"(?P<{prefix}type>\w+)"
+    scope_cgp = rf"(?P<{prefix}scope>\w*)"
+    subject_cgp = rf"(?P<{prefix}subject>.+)"
+
+    pattern_string = pattern_string.replace(r"\{type\}", action_cgp).replace(
+        r"\{scope\}", scope_cgp
+    )
+
+    if label_position == "header":
+        pattern_string = pattern_string.replace(r"\{subject\}", subject_cgp)
+
+    return pattern_string
+
+
+class LabelMatcher:
+    """Match commits against one or more message conventions. See
+    :func:`commit_analyzer` for the syntax of ``label_pattern``.
+
+    ``label_pattern`` can be a single pattern or a sequence of them, where
+    each item is either a pattern, located in ``label_position``, or a
+    ``(pattern, position)`` pair. All the patterns for a same position are
+    combined in a single regular expression, so every commit is searched at
+    most once per position, no matter how many conventions there are.
+
+    Positions are searched in the order they first appear in the sequence.
+    """
+
+    def __init__(self, label_pattern, label_position="footer"):
+
+        if isinstance(label_pattern, str):
+            label_pattern = [label_pattern]
+
+        conventions = []
+
+        for item in label_pattern:
+            if isinstance(item, str):
+                item = (item, label_position)
+
+            conventions.append(tuple(item))
+
+        self.conventions = tuple(conventions)
+
+        alternatives = OrderedDict()
+        self._groups = {}
+
+        for index, (pattern, position) in enumerate(self.conventions):
+            name = f"c{index}"
+            prefix = f"{name}_"
+            regexp = _label_regexp(pattern, position, prefix)
+            alternatives.setdefault(position, []).append(f"(?P<{name}>{regexp})")
+
+            # Names of the capturing groups of each convention
+            self._groups[name] = (
+                pattern,
+                f"{prefix}type",
+                f"{prefix}scope" if "{scope}" in pattern else None,
+                f"{prefix}subject" if position == "header" else None,
+            )
+
+        self._searchers = [
+            (attrgetter(position), re.compile("|".join(regexps)).search)
+            for position, regexps in alternatives.items()
+        ]
+
+    def match(self, commit):
+        """Return a :class:`SemanticCommit` if the commit matches any of the
+        conventions, otherwise **None**."""
+
+        for get_text, search in self._searchers:
+            match = search(get_text(commit))
+
+            if match:
+                break
+        else:
+            return None
+
+        pattern, type_group, scope_group, subject_group = self._groups[
+            match.lastgroup
+        ]
+
+        subject = match.group(subject_group) if subject_group else commit.header
+        scope = match.group(scope_group) if scope_group else None
+
+        return SemanticCommit(
+            subject=subject.strip(),
+            type=match.group(type_group),
+            scope=scope or None,
+            message=commit.message,
+            convention=pattern,
+        )
+
+    def match_many(self, commits):
+        """Return a list of :class:`SemanticCommit` for the given commits that
+        match the label pattern, preserving their order."""
+
+        return [sc for sc in map(self.match, commits) if sc is not None]
+
+
+@lru_cache(maxsize=64)
+def get_label_matcher(label_pattern, label_position="footer"):
+    """Return a :class:`LabelMatcher`, reusing the ones already built for the
+    same pattern and position."""
+
+    return LabelMatcher(label_pattern, label_position)
+
+
+def _hashable_label_pattern(label_pattern):
+    """Turn a list of label patterns into a tuple, so it can be used as a key
+    of the label matchers cache."""
+
+    if isinstance(label_pattern, str):
+        return label_pattern
+
+    return tuple(
+        item if isinstance(item, str) else tuple(item) for item in label_pattern
+    )
+
+
+# Commit ranges below this size are analyzed serially even if workers are
+# requested, since starting a process pool costs more than the analysis.
+PARALLEL_THRESHOLD = 10000
+
+# Number of commits sent to a worker process at once.
+CHUNK_SIZE = 2000
+
+# What a worker process receives from each commit.
+_CommitFields = namedtuple("_CommitFields", ["header", "footer", "message"])
+
+
+def _match_chunk(label_pattern, label_position, chunk):
+    """Classify a chunk of (header, footer) pairs in a worker process.
+
+    Return a list with a ``(subject, type, scope, convention)`` tuple for each
+    commit that matches, or **None** for the ones that don't.
+    """
+
+    match = get_label_matcher(label_pattern, label_position).match
+    results = []
+
+    for header, footer in chunk:
+        sc = match(_CommitFields(header, footer, None))
+        results.append(None if sc is None else (sc[0],) + sc[2:])
+
+    return results
 
 
-def commit_analyzer(commits, label_pattern, label_position="footer"):
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+def _parallel_analysis(commits, label_pattern, label_position, workers):
+    semantic_commits = []
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+
+        # Commits are consumed in batches to keep memory bounded when
+        # they come from a stream.
+        for batch in _chunks(commits, workers * CHUNK_SIZE):
+            fields = [(commit.header, commit.footer) for commit in batch]
+
+            results = chain.from_iterable(
+                executor.map(
+                    _match_chunk,
+                    repeat(label_pattern),
+                    repeat(label_position),
+                    _chunks(fields, CHUNK_SIZE),
+                )
+            )
+
+            for commit, result in zip(batch, results):
+                if result:
+                    sc = SemanticCommit(result[0], commit.message, *result[1:])
+                    semantic_commits.append(sc)
+
+    return semantic_commits
+
+
+def commit_analyzer(
+    commits,
+    label_pattern,
+    label_position="footer",
+    workers=None,
+    parallel_threshold=PARALLEL_THRESHOLD,
+):
     """Analyzes a list of :class:`~braulio.git.Commit` objects searching for
     messages that match a given message convention and extract metadata from
     them.
@@ -177,63 +718,151 @@ def commit_analyzer(commits, label_pattern, label_position="footer"):
             'scope': 'cli',
             'subject': 'Ensure --help option doesn't hang'
         }
+
+    Repositories that mix several conventions can pass a list in
+    ``label_pattern``. Each item is a pattern or a ``(pattern, position)``
+    pair, and the ``convention`` field of the resulting
+    :class:`SemanticCommit` tells which pattern matched::
+
+        commit_analyzer(
+            commits, ["!{type}:{scope}", ("{type}({scope}): {subject}", "header")]
+        )
+
+    If ``workers`` is greater than one, commits are classified in a pool of
+    that many processes, preserving their order. Fewer commits than
+    ``parallel_threshold`` are always analyzed in the current process.
     """
 
-    # Internally, a real regular expression pattern is used
-    pattern_string = re.escape(label_pattern)
+    label_pattern = _hashable_label_pattern(label_pattern)
 
-    # Capturing group patterns
-    action_cgp = r"(?P<type>\w+)"
-    scope_cgp = r"(?P<scope>\w*)"
-    subject_cgp = r"(?P<subject>.+)"
+    if workers and workers > 1:
+        commits = iter(commits)
+        head = list(islice(commits, parallel_threshold))
 
-    pattern_string = pattern_string.replace(r"\{type\}", action_cgp).replace(
-        r"\{scope\}", scope_cgp
-    )
-    if label_position == "header":
-        pattern_string = pattern_string.replace(r"\{subject\}", subject_cgp)
+        if len(head) == parallel_threshold:
+            commits = chain(head, commits)
+            return _parallel_analysis(commits, label_pattern, label_position, workers)
 
-    regexp_pattern = re.compile(pattern_string)
+        commits = head
 
-    semantic_commits = []
+    matcher = get_label_matcher(label_pattern, label_position)
 
-    for commit in commits:
-        text = commit.header if label_position == "header" else commit.footer
-        match = regexp_pattern.search(text)
+    return matcher.match_many(commits)
 
-        if not match:
-            continue
 
-        metadata = match.groupdict()
+def _tag_regexp(tag_pattern, Version, multiline=False):
+    tag_pattern = re.escape(tag_pattern).replace(r"\{version\}", Version.pattern)
 
-        if label_position == "footer":
-            metadata["subject"] = commit.header
+    if multiline:
+        # Match at the start of every line, like re.match does in a name
+        return re.compile(f"^{tag_pattern}", re.M)
 
-        sc = SemanticCommit(
-            subject=metadata["subject"].strip(),
-            type=metadata["type"],
-            scope=metadata.get("scope") or None,
-            message=commit.message,
-        )
+    return re.compile(tag_pattern)
 
-        semantic_commits.append(sc)
 
-    return semantic_commits
+def _tag_version(tag_regex, tag, Version):
+    """Return the version of a tag, or **None** if the tag name doesn't match
+    the tag pattern."""
 
+    match = tag_regex.match(tag.name)
 
-def tag_analyzer(tags, tag_pattern, Version):
+    if not match:
+        return None
 
-    tag_pattern = re.escape(tag_pattern).replace(r"\{version\}", Version.pattern)
+    version = Version(**match.groupdict())
+    version.tag = tag
 
+    return version
+
+
+def _cached_tag_version(tag_regex, tag, Version, cache):
+    try:
+        version = cache.get(tag.name)
+    except KeyError:
+        version = _tag_version(tag_regex, tag, Version)
+        cache.set(tag.name, version)
+    else:
+        if version is not None:
+            version.tag = tag
+
+    return version
+
+
+def _batch_tag_versions(tags, tag_pattern, Version):
+    """Yield the version of each tag that matches ``tag_pattern``, running a
+    single regex search over the tag names joined by new lines."""
+
+    # Start position of each name in the buffer
+    tag_starts = {}
+    position = 0
+
+    for tag in tags:
+        tag_starts[position] = tag
+        position += len(tag.name) + 1
+
+    buffer = "\n".join(tag.name for tag in tag_starts.values())
+    tag_regex = _tag_regexp(tag_pattern, Version, multiline=True)
+
+    matches = list(tag_regex.finditer(buffer))
+
+    for match, version in zip(matches, Version.from_matches(matches)):
+        version.tag = tag_starts[match.start()]
+        yield version
+
+
+def _batch_tag_analyzer(tags, tag_pattern, Version, cache):
+    versions = []
+
+    if cache is not None:
+        new_tags = []
+
+        for tag in tags:
+            try:
+                version = cache.get(tag.name)
+            except KeyError:
+                new_tags.append(tag)
+                cache.set(tag.name, None)
+            else:
+                if version is not None:
+                    version.tag = tag
+                    versions.append(version)
+
+        tags = new_tags
+
+    for version in _batch_tag_versions(tags, tag_pattern, Version):
+        if cache is not None:
+            cache.set(version.tag.name, version)
+
+        versions.append(version)
+
+    versions.sort(key=attrgetter("_number"), reverse=True)
+    return versions
+
+
+def tag_analyzer(tags, tag_pattern, Version, cache=None, batch=False):
+    """Return the versions of the tags whose name matches ``tag_pattern``,
+    in the same order as the tags.
+
+    If a ``cache`` is given, like a :class:`~braulio.cache.TagCache`, only
+    the tags missing from it are matched against the pattern.
+
+    With ``batch``, all the tags are matched at once, which is faster for
+    large tag lists, and the versions are returned sorted, highest first.
+    """
+
+    if batch:
+        return _batch_tag_analyzer(tags, tag_pattern, Version, cache)
+
+    tag_regex = _tag_regexp(tag_pattern, Version)
     versions = []
-    tag_regex = re.compile(tag_pattern)
 
     for tag in tags:
-        match = tag_regex.match(tag.name)
+        if cache is None:
+            version = _tag_version(tag_regex, tag, Version)
+        else:
+            version = _cached_tag_version(tag_regex, tag, Version, cache)
 
-        if match:
-            version = Version(**match.groupdict())
-            version.tag = tag
+        if version is not None:
             versions.append(version)
 
     return versions
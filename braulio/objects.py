@@ -0,0 +1,985 @@
+"""Read-only access to the Git object database without running git.
+
+Loose objects are decompressed with :mod:`zlib`, and packfiles are accessed
+through :mod:`mmap` with their ``.idx`` files, resolving deltas in Python.
+"""
+
+import heapq
+import mmap
+import os
+import struct
+import zlib
+from binascii import hexlify, unhexlify
+from collections import OrderedDict
+from pathlib import Path
+from datetime import datetime, timedelta, timezone
+from braulio.git import Commit, Tag, _split_commit_object
+
+
+OBJECT_TYPES = {1: "commit", 2: "tree", 3: "blob", 4: "tag"}
+OFS_DELTA = 6
+REF_DELTA = 7
+
+IDX_MAGIC = b"\377tOc"
+
+# How many bytes of a packfile are fed to zlib at once.
+READ_SIZE = 16384
+
+
+def find_git_dir(path=None):
+    """Look for the .git directory of the repository that contains ``path``,
+    by default the current working directory. Return **None** if there isn't
+    a repository."""
+
+    path = Path(path or Path.cwd()).resolve()
+
+    for directory in [path] + list(path.parents):
+        dot_git = directory / ".git"
+
+        if dot_git.is_dir():
+            return dot_git
+
+        # Worktrees and submodules have a file pointing to the git directory
+        if dot_git.is_file():
+            content = dot_git.read_text().strip()
+
+            if content.startswith("gitdir:"):
+                return (directory / content[7:].strip()).resolve()
+
+    return None
+
+
+def common_git_dir(git_dir):
+    """Return the directory shared by every worktree of the repository, where
+    the objects and most references are stored. A linked worktree has a
+    ``commondir`` file pointing to it, otherwise it is ``git_dir`` itself."""
+
+    git_dir = Path(git_dir)
+
+    try:
+        common_dir = (git_dir / "commondir").read_text().strip()
+    except OSError:
+        return git_dir
+
+    return (git_dir / common_dir).resolve()
+
+
+def _is_worktree_ref(name):
+    """Return **True** if the reference ``name`` is stored in the directory
+    of each worktree instead of the common directory."""
+
+    return not name.startswith("refs/") or name.startswith(
+        ("refs/worktree/", "refs/bisect/", "refs/rewritten/")
+    )
+
+
+def _has_ref_storage(common_dir):
+    """Return **True** if the references of the repository are stored as
+    loose files or in a packed-refs file, which is all this module can read.
+    Repositories using the reftable format have to be read with git."""
+
+    if (common_dir / "reftable").exists():
+        return False
+
+    return (common_dir / "refs").is_dir() or (common_dir / "packed-refs").is_file()
+
+
+def _short_date(timestamp, utc_offset):
+    """Format a timestamp as YYYY-MM-DD in the given timezone, like the
+    ``short`` date format of git."""
+
+    minutes = int(utc_offset[1:3]) * 60 + int(utc_offset[3:5])
+    offset = timedelta(minutes=-minutes if utc_offset[0] == "-" else minutes)
+
+    return datetime.fromtimestamp(timestamp, timezone(offset)).strftime("%Y-%m-%d")
+
+
+def refs_watermark(git_dir, prefix="refs/tags"):
+    """Return a list of numbers that changes whenever a reference under
+    ``prefix`` is added, removed or updated: the modification time and size
+    of the packed-refs file, the number of loose references and the latest
+    modification time of their directories.
+
+    Git updates references renaming a lock file, so the modification time
+    of the directory that contains a loose reference changes with it.
+
+    The references are looked up in the common directory of linked
+    worktrees. Return **None** if there isn't any reference storage to
+    watch, like in reftable repositories.
+    """
+
+    git_dir = common_git_dir(git_dir)
+
+    if not _has_ref_storage(git_dir):
+        return None
+
+    try:
+        stat = (git_dir / "packed-refs").stat()
+        watermark = [stat.st_mtime_ns, stat.st_size]
+    except OSError:
+        watermark = [0, 0]
+
+    count = 0
+    latest = 0
+    directories = [git_dir / prefix]
+
+    while directories:
+        directory = directories.pop()
+
+        try:
+            latest = max(latest, directory.stat().st_mtime_ns)
+            entries = list(os.scandir(directory))
+        except OSError:
+            continue
+
+        for entry in entries:
+            if entry.is_dir():
+                directories.append(Path(entry.path))
+            else:
+                count += 1
+
+    return watermark + [count, latest]
+
+
+def _apply_delta(base, delta):
+    """Build an object from its base object and a delta instruction set."""
+
+    def varint(pos):
+        value = shift = 0
+
+        while True:
+            byte = delta[pos]
+            pos += 1
+            value |= (byte & 0x7F) << shift
+            shift += 7
+
+            if not byte & 0x80:
+                return value, pos
+
+    base_size, pos = varint(0)
+    result_size, pos = varint(pos)
+
+    if base_size != len(base):
+        raise ValueError("Delta base size mismatch")
+
+    result = bytearray()
+    delta_size = len(delta)
+
+    while pos < delta_size:
+        opcode = delta[pos]
+        pos += 1
+
+        if opcode & 0x80:
+            # Copy a slice of the base object
+            offset = size = 0
+
+            for i in range(4):
+                if opcode & (1 << i):
+                    offset |= delta[pos] << (8 * i)
+                    pos += 1
+
+            for i in range(3):
+                if opcode & (0x10 << i):
+                    size |= delta[pos] << (8 * i)
+                    pos += 1
+
+            end = offset + (size or 0x10000)
+            result += base[offset:end]
+        elif opcode:
+            # Insert the next bytes of the delta
+            end = pos + opcode
+            result += delta[pos:end]
+            pos = end
+        else:
+            raise ValueError("Invalid delta opcode")
+
+    if len(result) != result_size:
+        raise ValueError("Delta result size mismatch")
+
+    return bytes(result)
+
+
+class Pack:
+    """A packfile and its version 2 index, both memory-mapped."""
+
+    def __init__(self, idx_path):
+        self.idx_path = idx_path
+        self.pack_path = idx_path.with_suffix(".pack")
+
+        with idx_path.open("rb") as f:
+            self._idx = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        with self.pack_path.open("rb") as f:
+            self._pack = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        idx = self._idx
+
+        if idx[:4] != IDX_MAGIC or struct.unpack_from(">I", idx, 4)[0] != 2:
+            raise ValueError(f"Unsupported pack index {idx_path}")
+
+        self._fanout = struct.unpack_from(">256I", idx, 8)
+        self.size = self._fanout[255]
+
+        self._names_offset = 8 + 256 * 4
+        self._offsets_offset = self._names_offset + self.size * 24
+        self._large_offsets_offset = self._offsets_offset + self.size * 4
+
+    def close(self):
+        self._idx.close()
+        self._pack.close()
+
+    def _name(self, index):
+        start = self._names_offset + index * 20
+        end = start + 20
+        return self._idx[start:end]
+
+    def offset(self, binary_sha):
+        """Return the offset of an object in the packfile, or **None** if the
+        object isn't in this pack."""
+
+        first = binary_sha[0]
+        low = self._fanout[first - 1] if first else 0
+        high = self._fanout[first]
+
+        while low < high:
+            middle = (low + high) // 2
+            name = self._name(middle)
+
+            if name < binary_sha:
+                low = middle + 1
+            elif name > binary_sha:
+                high = middle
+            else:
+                position = self._offsets_offset + middle * 4
+                offset = struct.unpack_from(">I", self._idx, position)[0]
+
+                # The most significant bit points to the large offsets table
+                if offset & 0x80000000:
+                    position = self._large_offsets_offset
+                    position += (offset & 0x7FFFFFFF) * 8
+                    offset = struct.unpack_from(">Q", self._idx, position)[0]
+
+                return offset
+
+        return None
+
+    def _decompress(self, offset, size):
+        decompressor = zlib.decompressobj()
+        view = memoryview(self._pack)
+        chunks = []
+
+        try:
+            while not decompressor.eof:
+                end = offset + READ_SIZE
+                chunk = view[offset:end]
+
+                if not chunk:
+                    raise ValueError(f"Truncated packfile {self.pack_path}")
+
+                chunks.append(decompressor.decompress(chunk))
+                offset += READ_SIZE
+        finally:
+            view.release()
+
+        data = b"".join(chunks)
+
+        if len(data) != size:
+            raise ValueError(f"Corrupted object in {self.pack_path}")
+
+        return data
+
+    def read_entry(self, offset):
+        """Return the raw entry at the given offset as a tuple of type number,
+        delta base (an offset or a binary sha, if it is a delta) and data."""
+
+        pack = self._pack
+        start = offset
+        byte = pack[offset]
+        offset += 1
+
+        type_number = (byte >> 4) & 7
+        size = byte & 15
+        shift = 4
+
+        while byte & 0x80:
+            byte = pack[offset]
+            offset += 1
+            size |= (byte & 0x7F) << shift
+            shift += 7
+
+        base = None
+
+        if type_number == OFS_DELTA:
+            byte = pack[offset]
+            offset += 1
+            distance = byte & 0x7F
+
+            while byte & 0x80:
+                byte = pack[offset]
+                offset += 1
+                distance = ((distance + 1) << 7) | (byte & 0x7F)
+
+            # Distance is counted from the start of this entry
+            base = start - distance
+        elif type_number == REF_DELTA:
+            end = offset + 20
+            base = pack[offset:end]
+            offset = end
+
+        return type_number, base, self._decompress(offset, size)
+
+
+class CommitGraph:
+    """A commit-graph file (``.git/objects/info/commit-graph``), which stores
+    the parents, commit date and generation number of every commit it knows
+    about, so the history can be walked without inflating commit objects.
+
+    Only single-file graphs are supported, split graph chains are ignored.
+    """
+
+    NO_PARENT = 0x70000000
+    EXTRA_EDGES = 0x80000000
+    LAST_EDGE = 0x80000000
+
+    def __init__(self, path):
+        self.path = path
+
+        with path.open("rb") as f:
+            self._data = data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        signature, version, hash_version, chunk_count, base_count = (
+            struct.unpack_from(">4sBBBB", data, 0)
+        )
+
+        if signature != b"CGPH" or version != 1 or hash_version != 1 or base_count:
+            data.close()
+            raise ValueError(f"Unsupported commit-graph file {path}")
+
+        chunks = {}
+
+        for i in range(chunk_count):
+            chunk_id, offset = struct.unpack_from(">4sQ", data, 8 + i * 12)
+            chunks[chunk_id] = offset
+
+        self._fanout = struct.unpack_from(">256I", data, chunks[b"OIDF"])
+        self._oid_lookup = chunks[b"OIDL"]
+        self._commit_data = chunks[b"CDAT"]
+        self._extra_edges = chunks.get(b"EDGE")
+        self.size = self._fanout[255]
+
+    @classmethod
+    def open(cls, git_dir):
+        """Return the commit-graph of a git directory, or **None** if it
+        doesn't have one or it can't be read. Linked worktrees share the
+        commit-graph of the common directory."""
+
+        path = common_git_dir(git_dir) / "objects" / "info" / "commit-graph"
+
+        if not path.is_file():
+            return None
+
+        try:
+            return cls(path)
+        except (ValueError, KeyError, struct.error):
+            return None
+
+    def close(self):
+        self._data.close()
+
+    def __contains__(self, sha):
+        return self.position(sha) is not None
+
+    def position(self, sha):
+        """Return the position of a commit in the graph, or **None**."""
+
+        binary_sha = unhexlify(sha)
+        first = binary_sha[0]
+        low = self._fanout[first - 1] if first else 0
+        high = self._fanout[first]
+
+        while low < high:
+            middle = (low + high) // 2
+            start = self._oid_lookup + middle * 20
+            end = start + 20
+            name = self._data[start:end]
+
+            if name < binary_sha:
+                low = middle + 1
+            elif name > binary_sha:
+                high = middle
+            else:
+                return middle
+
+        return None
+
+    def sha(self, position):
+        start = self._oid_lookup + position * 20
+        end = start + 20
+        return hexlify(self._data[start:end]).decode()
+
+    def commit_info(self, position):
+        """Return a tuple with the positions of the parents, the generation
+        number and the commit date of the commit at ``position``."""
+
+        offset = self._commit_data + position * 36 + 20
+        first, second, generation, date = struct.unpack_from(
+            ">IIII", self._data, offset
+        )
+
+        parents = []
+
+        if first != self.NO_PARENT:
+            parents.append(first)
+
+        if second & self.EXTRA_EDGES and second != self.NO_PARENT:
+            # The rest of the parents are in the extra edges list
+            offset = self._extra_edges + (second & ~self.EXTRA_EDGES) * 4
+
+            while True:
+                edge = struct.unpack_from(">I", self._data, offset)[0]
+                parents.append(edge & ~self.LAST_EDGE)
+                offset += 4
+
+                if edge & self.LAST_EDGE:
+                    break
+        elif second != self.NO_PARENT:
+            parents.append(second)
+
+        # Generation number uses the 30 most significant bits, and the
+        # commit date the other 34 bits.
+        timestamp = ((generation & 3) << 32) | date
+
+        return parents, generation >> 2, timestamp
+
+
+def commit_graph_is_stale(store, graph, refs=("HEAD",)):
+    """Return **True** if there isn't a commit-graph, or some of the commits
+    pointed by ``refs`` aren't in it. It is always stale if the references
+    of ``store`` can't be read."""
+
+    if graph is None or not store.has_ref_storage:
+        return True
+
+    for ref in refs:
+        sha = store.resolve(ref)
+
+        if sha is not None and store.peel(sha) not in graph:
+            return True
+
+    return False
+
+
+class ObjectStore:
+    """Read objects from the object database of a git directory.
+
+    :meth:`read_object` has the same signature as
+    :meth:`braulio.git.GitSession.read_object`, but it only accepts object
+    hashes or names that :meth:`resolve` understands.
+
+    In a linked worktree, HEAD and the per-worktree references are read from
+    ``git_dir`` and everything else from the common directory. The object
+    directories listed in ``objects/info/alternates`` are searched as well.
+
+    Objects that aren't found there are read through ``session``, if given,
+    a :class:`~braulio.git.GitSession` that lets git look for them, like in
+    the directories of ``GIT_ALTERNATE_OBJECT_DIRECTORIES``.
+    """
+
+    def __init__(self, git_dir, cache_size=256, session=None):
+        self.git_dir = Path(git_dir)
+        self.session = session
+        self.common_dir = common_git_dir(self.git_dir)
+        self.objects_dir = self.common_dir / "objects"
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._object_dirs = None
+        self._packs = None
+
+    @property
+    def has_ref_storage(self):
+        """**True** if the references can be read, see
+        :func:`_has_ref_storage`."""
+
+        return _has_ref_storage(self.common_dir)
+
+    @property
+    def object_dirs(self):
+        """The objects directory followed by its alternates, recursively."""
+
+        if self._object_dirs is None:
+            object_dirs = [self.objects_dir]
+
+            # The list grows while it is iterated, alternates can be chained
+            for directory in object_dirs:
+                try:
+                    lines = (directory / "info" / "alternates").read_text()
+                except OSError:
+                    continue
+
+                for line in lines.splitlines():
+                    line = line.strip()
+
+                    if not line or line.startswith("#"):
+                        continue
+
+                    # Relative paths are relative to the objects directory
+                    alternate = (directory / line).resolve()
+
+                    if alternate not in object_dirs:
+                        object_dirs.append(alternate)
+
+            self._object_dirs = object_dirs
+
+        return self._object_dirs
+
+    @property
+    def packs(self):
+        if self._packs is None:
+            self._packs = []
+
+            for directory in self.object_dirs:
+                pack_dir = directory / "pack"
+
+                if pack_dir.is_dir():
+                    idx_paths = sorted(pack_dir.glob("*.idx"))
+                    self._packs += [Pack(path) for path in idx_paths]
+
+        return self._packs
+
+    def close(self):
+        for pack in self._packs or []:
+            pack.close()
+
+        self._packs = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _cached(self, key):
+        value = self._cache.get(key)
+
+        if value is not None:
+            self._cache.move_to_end(key)
+
+        return value
+
+    def _store(self, key, value):
+        self._cache[key] = value
+
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+
+    def _read_loose(self, sha):
+        for directory in self.object_dirs:
+            try:
+                raw = zlib.decompress((directory / sha[:2] / sha[2:]).read_bytes())
+                break
+            except FileNotFoundError:
+                continue
+        else:
+            return None
+
+        header, _, data = raw.partition(b"\0")
+        object_type, size = header.decode().split()
+
+        if int(size) != len(data):
+            raise ValueError(f"Corrupted loose object {sha}")
+
+        return object_type, data
+
+    def _read_packed_entry(self, pack, offset):
+        cached = self._cached((pack.pack_path, offset))
+
+        if cached:
+            return cached
+
+        type_number, base, data = pack.read_entry(offset)
+
+        if type_number == OFS_DELTA:
+            base_type, base_data = self._read_packed_entry(pack, base)
+            result = base_type, _apply_delta(base_data, data)
+        elif type_number == REF_DELTA:
+            base_type, base_data = self._read(hexlify(base).decode())
+            result = base_type, _apply_delta(base_data, data)
+        else:
+            result = OBJECT_TYPES[type_number], data
+
+        self._store((pack.pack_path, offset), result)
+
+        return result
+
+    def _read(self, sha):
+        binary_sha = unhexlify(sha)
+
+        for pack in self.packs:
+            offset = pack.offset(binary_sha)
+
+            if offset is not None:
+                return self._read_packed_entry(pack, offset)
+
+        loose = self._read_loose(sha)
+
+        if loose is not None:
+            return loose
+
+        if self.session is not None:
+            obj = self.session.read_object(sha)
+
+            if obj is not None:
+                return obj[1], obj[2]
+
+        raise KeyError(sha)
+
+    def read_object(self, rev):
+        """Return a ``(hash, type, data)`` tuple, or **None** if the object
+        doesn't exist."""
+
+        sha = self.resolve(rev)
+
+        if sha is None:
+            return None
+
+        try:
+            object_type, data = self._read(sha)
+        except KeyError:
+            return None
+
+        return sha, object_type, data
+
+    def _ref_dir(self, name):
+        return self.git_dir if _is_worktree_ref(name) else self.common_dir
+
+    def _read_ref(self, name):
+        path = self._ref_dir(name) / name
+
+        if path.is_file():
+            value = path.read_text().strip()
+
+            if value.startswith("ref: "):
+                return self._read_ref(value[5:])
+
+            return value
+
+        packed_refs = self.common_dir / "packed-refs"
+
+        if packed_refs.is_file():
+            with packed_refs.open() as f:
+                for line in f:
+                    if line.startswith(("#", "^")):
+                        continue
+
+                    sha, _, ref_name = line.rstrip("\n").partition(" ")
+
+                    if ref_name == name:
+                        return sha
+
+        return None
+
+    def resolve(self, rev):
+        """Return the hash of the object named by ``rev``, which can be a full
+        hash, HEAD or a reference name. Return **None** if it can't be
+        resolved."""
+
+        if len(rev) == 40 and all(c in "0123456789abcdef" for c in rev):
+            return rev
+
+        if rev == "HEAD" or rev.startswith("refs/"):
+            return self._read_ref(rev)
+
+        for prefix in ("refs/", "refs/tags/", "refs/heads/", "refs/remotes/"):
+            sha = self._read_ref(prefix + rev)
+
+            if sha:
+                return sha
+
+        return None
+
+    def refs(self, prefix="refs/"):
+        """Return a dict with the hash of each reference whose name starts
+        with ``prefix``. Loose references take precedence over the ones in
+        the packed-refs file."""
+
+        refs = {}
+        packed_refs = self.common_dir / "packed-refs"
+
+        if packed_refs.is_file():
+            with packed_refs.open() as f:
+                for line in f:
+                    if line.startswith(("#", "^")):
+                        continue
+
+                    sha, _, ref_name = line.rstrip("\n").partition(" ")
+
+                    if ref_name.startswith(prefix):
+                        refs[ref_name] = sha
+
+        for base_dir in {self.common_dir, self.git_dir}:
+            ref_dir = base_dir / prefix.rpartition("/")[0]
+
+            if not ref_dir.is_dir():
+                continue
+
+            for path in ref_dir.rglob("*"):
+                ref_name = path.relative_to(base_dir).as_posix()
+
+                if (
+                    path.is_file()
+                    and ref_name.startswith(prefix)
+                    and self._ref_dir(ref_name) == base_dir
+                ):
+                    refs[ref_name] = self._read_ref(ref_name)
+
+        return refs
+
+    def creator_date(self, sha):
+        """Return the date of the tagger of an annotated tag or the committer
+        of a commit, as a ``(timestamp, utc_offset)`` tuple. Objects without
+        a date, like trees, return ``(0, "+0000")``."""
+
+        object_type, data = self._read(sha)
+        field = {"tag": "tagger ", "commit": "committer "}.get(object_type)
+
+        if field is not None:
+            headers, _ = _split_commit_object(data)
+
+            for line in headers.split("\n"):
+                if line.startswith(field):
+                    _, timestamp, utc_offset = line.rsplit(" ", 2)
+                    return int(timestamp), utc_offset
+
+        return 0, "+0000"
+
+    def tags(self, match=None):
+        """Return a list of :class:`~braulio.git.Tag` sorted by creator date,
+        newest first, like :meth:`braulio.git.Git.tag`.
+
+        Only the tags whose name satisfies the ``match`` callable are
+        returned, so their objects are the only ones read.
+        """
+
+        dated_tags = []
+
+        for ref_name, sha in self.refs("refs/tags/").items():
+            name = ref_name[10:]
+
+            if match is not None and not match(name):
+                continue
+
+            timestamp, utc_offset = self.creator_date(sha)
+            dated_tags.append((timestamp, utc_offset, name))
+
+        # Like git-tag --sort=creatordate, ties are sorted by name
+        dated_tags.sort(key=lambda item: (item[0], item[2]), reverse=True)
+
+        return [
+            Tag(f"{_short_date(timestamp, utc_offset)}\t{name}")
+            for timestamp, utc_offset, name in dated_tags
+        ]
+
+    def peel(self, sha):
+        """Follow annotated tags until a non-tag object is found."""
+
+        object_type, data = self._read(sha)
+
+        while object_type == "tag":
+            sha = data[7:47].decode()
+            object_type, data = self._read(sha)
+
+        return sha
+
+    def read_commit(self, sha):
+        """Return a tuple of :class:`~braulio.git.Commit`, its parent hashes
+        and its committer timestamp."""
+
+        object_type, data = self._read(sha)
+
+        if object_type != "commit":
+            raise ValueError(f"{sha} is not a commit")
+
+        headers, message = _split_commit_object(data)
+        parents = []
+        timestamp = 0
+
+        for line in headers.split("\n"):
+            if line.startswith("parent "):
+                parents.append(line[7:])
+            elif line.startswith("committer "):
+                timestamp = int(line.rsplit(" ", 2)[1])
+
+        return Commit.from_fields(sha, message), parents, timestamp
+
+
+def walk_commits(store, head="HEAD", stop=None, graph=None):
+    """Yield the commits reachable from ``head`` that are not reachable from
+    ``stop``, as in ``git log stop..head``, newest first.
+
+    The walk goes through a priority queue ordered by commit date, like git
+    does, and it ends as soon as every commit left in the queue is reachable
+    from ``stop``. Only the parents of each commit are kept meanwhile, the
+    message of a commit is read again when it is yielded.
+
+    If a :class:`CommitGraph` is given, see :func:`_walk_graph`.
+    """
+
+    head_sha = store.resolve(head)
+
+    if head_sha is None:
+        raise ValueError(f"Unknown revision {head}")
+
+    starts = [(store.peel(head_sha), False)]
+
+    if stop is not None:
+        stop_sha = store.resolve(stop)
+
+        if stop_sha is None:
+            raise ValueError(f"Unknown revision {stop}")
+
+        starts.append((store.peel(stop_sha), True))
+
+    if graph is not None:
+        yield from _walk_graph(store, graph, starts)
+        return
+
+    # sha -> True if reachable from stop
+    uninteresting = {}
+    parents_of = {}
+    queue = []
+    counter = 0
+
+    def mark_ancestors(sha):
+        # A commit that became uninteresting after being processed
+        # propagates the flag to the ancestors already seen.
+        pending = [sha]
+
+        while pending:
+            for parent in parents_of[pending.pop()]:
+                if not uninteresting.get(parent, True):
+                    uninteresting[parent] = True
+                    pending.append(parent)
+
+    def push(sha, flag):
+        nonlocal counter
+
+        if sha in uninteresting:
+            if flag and not uninteresting[sha]:
+                uninteresting[sha] = True
+                mark_ancestors(sha)
+            return
+
+        _, parents, timestamp = store.read_commit(sha)
+        parents_of[sha] = parents
+        uninteresting[sha] = flag
+        counter += 1
+        heapq.heappush(queue, (-timestamp, counter, sha))
+
+    for sha, flag in starts:
+        push(sha, flag)
+
+    output = []
+
+    # Stop when only commits reachable from stop are left in the queue
+    while queue and not all(uninteresting[sha] for _, _, sha in queue):
+        _, _, sha = heapq.heappop(queue)
+        flag = uninteresting[sha]
+
+        if not flag:
+            output.append(sha)
+
+        for parent in parents_of[sha]:
+            push(parent, flag)
+
+    for sha in output:
+        if not uninteresting[sha]:
+            yield store.read_commit(sha)[0]
+
+
+# Generation number of the commits that aren't in the commit-graph. They
+# are newer than the graph, so they go before any commit in the graph.
+GENERATION_INFINITY = 0xFFFFFFFF
+
+
+def _walk_graph(store, graph, starts):
+    """Walk the history with the parents and generation numbers stored in a
+    commit-graph.
+
+    Commits are processed by descending generation number. Since a commit
+    can only be reached from commits with a higher generation, when a commit
+    is processed it is already known if ``stop`` reaches it. Thus, the walk
+    ends exactly when every commit left in the queue is reachable from
+    ``stop``, and commit objects are only inflated for the commits yielded.
+
+    The commits found are then yielded in the same order as
+    :func:`walk_commits`.
+    """
+
+    uninteresting = {}
+    parents_of = {}
+    timestamps = {}
+    queue = []
+    counter = 0
+
+    def push(sha, flag):
+        nonlocal counter
+
+        if sha in uninteresting:
+            uninteresting[sha] = uninteresting[sha] or flag
+            return
+
+        position = graph.position(sha)
+
+        if position is None:
+            _, parents, timestamp = store.read_commit(sha)
+            generation = GENERATION_INFINITY
+        else:
+            parent_positions, generation, timestamp = graph.commit_info(position)
+            parents = [graph.sha(p) for p in parent_positions]
+
+        parents_of[sha] = parents
+        timestamps[sha] = timestamp
+        uninteresting[sha] = flag
+        counter += 1
+        heapq.heappush(queue, (-generation, -timestamp, counter, sha))
+
+    for sha, flag in starts:
+        push(sha, flag)
+
+    output = []
+
+    while queue and not all(uninteresting[sha] for *_, sha in queue):
+        *_, sha = heapq.heappop(queue)
+        flag = uninteresting[sha]
+
+        if not flag:
+            output.append(sha)
+
+        for parent in parents_of[sha]:
+            push(parent, flag)
+
+    interesting = {sha for sha in output if not uninteresting[sha]}
+
+    # The generation order only tells which commits are in the range. They
+    # are yielded in the order of the date ordered walk of walk_commits,
+    # which is the one of git-log even if commit dates are skewed. Commits
+    # in the range are only reached through other commits in the range, so
+    # the walk can be replayed over them alone.
+    queue = []
+    counter = 0
+
+    for sha, _ in starts:
+        if sha in interesting:
+            interesting.discard(sha)
+            counter += 1
+            heapq.heappush(queue, (-timestamps[sha], counter, sha))
+
+    while queue:
+        _, _, sha = heapq.heappop(queue)
+        yield store.read_commit(sha)[0]
+
+        for parent in parents_of[sha]:
+            if parent in interesting:
+                interesting.discard(parent)
+                counter += 1
+                heapq.heappush(queue, (-timestamps[parent], counter, parent))
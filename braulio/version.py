@@ -1,5 +1,8 @@
+import heapq
 import re
+from bisect import bisect_left, bisect_right
 from collections import OrderedDict, namedtuple
+from operator import attrgetter
 from string import Formatter
 
 
@@ -44,51 +47,130 @@ Stage = namedtuple("Stage", ["label", "serializer"])
 
 
 class Version:
+    """A version, made of the major, minor and patch numbers plus an
+    optional pre-release stage and its number.
+
+    Versions are created in bulk from the repository tags, so they are kept
+    light: the string is rendered only when it is needed, and the order is
+    given by a tuple of integers, :attr:`_number`, so there is no limit on
+    the size of each part.
+    """
+
+    __slots__ = (
+        "major",
+        "minor",
+        "patch",
+        "stage",
+        "n",
+        "tag",
+        "serializer",
+        "_number",
+        "_stage_number",
+        "_fields",
+        "_string",
+    )
 
     pattern = VERSION_STRING_PATTERN
 
     stages = {"final": Stage("final", "{major}.{minor}.{patch}")}
 
-    def __init__(self, string=None, major=0, minor=0, patch=0, stage=None, n=0):
+    # (stages, {stage: (index, serializer, serializer fields)}) computed
+    # from the stages the last time they were used.
+    _stage_map = (None, {})
 
-        self.tag = None
+    def __init__(self, string=None, major=0, minor=0, patch=0, stage=None, n=0):
 
         if string:
-            parts = parse_version_string_parts(string)
+            match = VERSION_STRING_REGEXP.match(string)
 
-            if not parts:
+            if not match:
                 raise ValueError(f"Invalid version string: {string}")
 
-            major, minor, patch, stage, n = parts.values()
+            major, minor, patch, stage, n = match.groups()
 
+        self._set_parts(major, minor, patch, stage, n, self._get_stage_map())
+
+    def _set_parts(self, major, minor, patch, stage, n, stage_map):
         stage = stage or "final"
-        n = 0 if stage == "final" else n
 
         try:
-            self.serializer = self.stages[stage].serializer
-            index = tuple(self.stages).index(stage)
+            index, serializer, fields = stage_map[stage]
         except KeyError:
             raise ValueError(f"{stage} is an unknown stage")
 
-        self.major = int(major)
-        self.minor = int(minor)
-        self.patch = int(patch)
-        self.stage = stage or None
-        self.n = int(n)
+        self.tag = None
+        self.major = major = int(major or 0)
+        self.minor = minor = int(minor or 0)
+        self.patch = patch = int(patch or 0)
+        self.stage = stage
+        self.n = n = 0 if stage == "final" else int(n or 0)
+
+        self.serializer = serializer
+        self._fields = fields
+        self._string = None
+        self._stage_number = index
+
+        self._number = (major, minor, patch, index, n)
 
-        args = major, minor, patch, index, n
-        self._number = int("{:0>3}{:0>3}{:0>3}{:0>3}{:0>3}".format(*args))
+    @classmethod
+    def _get_stage_map(cls):
+        stages, stage_map = cls._stage_map
 
-        parts = {}
-        serializer = self.serializer
+        # Stages can be replaced at any time, not only with set_stages
+        if stages is not cls.stages:
+            stage_map = {}
 
-        for p in Formatter().parse(serializer):
-            part = p[1]
-            if part:
-                parts[p[1]] = getattr(self, p[1])
+            for index, (key, stage) in enumerate(cls.stages.items()):
+                fields = tuple(
+                    field for _, field, _, _ in Formatter().parse(stage.serializer)
+                    if field
+                )
+                stage_map[key] = index, stage.serializer, fields
 
-        self._string = serializer.format(**parts)
-        self._stage_number = index
+            cls._stage_map = cls.stages, stage_map
+
+        return stage_map
+
+    @classmethod
+    def parse_many(cls, strings):
+        """Return the versions of the given strings, lowest first. Strings
+        that aren't valid versions, unknown stages included, are skipped.
+
+        All the strings are parsed with a single regex search over them
+        joined by new lines, so they can't contain new lines.
+        """
+
+        regexp = re.compile(f"^{cls.pattern}$", re.M)
+        matches = regexp.finditer("\n".join(strings))
+
+        versions = list(cls.from_matches(matches, strict=False))
+        versions.sort(key=attrgetter("_number"))
+
+        return versions
+
+    @classmethod
+    def from_matches(cls, matches, strict=True):
+        """Yield a version for each match of :attr:`pattern`, without
+        going through the string parsing of the constructor.
+
+        A match with an unknown stage raises :class:`ValueError`, or it is
+        skipped if ``strict`` is unset.
+        """
+
+        stage_map = cls._get_stage_map()
+        new = cls.__new__
+
+        for match in matches:
+            version = new(cls)
+
+            try:
+                version._set_parts(*match.groups(), stage_map)
+            except ValueError:
+                if strict:
+                    raise
+                continue
+
+            yield version
 
     @classmethod
     def set_stages(cls, stages):
@@ -124,7 +206,7 @@ class Version:
             if bump_part == self.stage:
                 n += 1
             else:
-                new_stage_number = tuple(self.stages).index(bump_part)
+                new_stage_number = self._get_stage_map()[bump_part][0]
 
                 # We can not bump to a previous stage
                 if new_stage_number < self._stage_number:
@@ -156,6 +238,10 @@ class Version:
 
     @property
     def string(self):
+        if self._string is None:
+            parts = {field: getattr(self, field) for field in self._fields}
+            self._string = self.serializer.format(**parts)
+
         return self._string
 
     def _is_comparable(self, value):
@@ -166,20 +252,48 @@ class Version:
                 f" and '{type(value)}'"
             )
 
+    # The comparison methods check the exact class first, since comparing
+    # two instances of Version is by far the most common case.
+
     def __eq__(self, v):
-        self._is_comparable(v)
+        if v.__class__ is not Version:
+            self._is_comparable(v)
 
         return self._number == v._number
 
+    def __ne__(self, v):
+        if v.__class__ is not Version:
+            self._is_comparable(v)
+
+        return self._number != v._number
+
     def __lt__(self, v):
-        self._is_comparable(v)
+        if v.__class__ is not Version:
+            self._is_comparable(v)
+
         return self._number < v._number
 
     def __le__(self, v):
-        self._is_comparable(v)
+        if v.__class__ is not Version:
+            self._is_comparable(v)
 
         return self._number <= v._number
 
+    def __gt__(self, v):
+        if v.__class__ is not Version:
+            self._is_comparable(v)
+
+        return self._number > v._number
+
+    def __ge__(self, v):
+        if v.__class__ is not Version:
+            self._is_comparable(v)
+
+        return self._number >= v._number
+
+    def __hash__(self):
+        return hash(self._number)
+
     def __iter__(self):
         yield self.major
         yield self.minor
@@ -194,6 +308,105 @@ class Version:
         return f"Version('{self.string}')"
 
 
+class VersionIndex:
+    """Versions sorted by their number, so the queries made during a release
+    are binary searches instead of linear scans.
+
+    If some versions have the same number, only the first one is kept. Since
+    tags are listed newest first, that's the one of the newest tag.
+
+    The order in which the tags were created is kept apart: ``newest`` is the
+    version of the most recent tag, by default the first of ``versions``.
+    """
+
+    def __init__(self, versions=(), newest=None):
+        unique = {}
+
+        for version in versions:
+            unique.setdefault(version._number, version)
+
+            if newest is None:
+                newest = version
+
+        self._newest = newest
+
+        self._versions = sorted(unique.values(), key=lambda v: v._number)
+        self._keys = [version._number for version in self._versions]
+
+        # Same lists per stage
+        self._stages = {}
+
+        for version in self._versions:
+            keys, versions = self._stages.setdefault(version.stage, ([], []))
+            keys.append(version._number)
+            versions.append(version)
+
+    def __len__(self):
+        return len(self._versions)
+
+    def __iter__(self):
+        """Iterate over the versions, lowest first."""
+
+        return iter(self._versions)
+
+    def get(self, version):
+        """Return the indexed version equal to ``version``, or **None**."""
+
+        i = bisect_left(self._keys, version._number)
+
+        if i < len(self._keys) and self._keys[i] == version._number:
+            return self._versions[i]
+
+        return None
+
+    def floor(self, version):
+        """Return the highest version lower or equal to ``version``, or
+        **None**."""
+
+        i = bisect_right(self._keys, version._number)
+        return self._versions[i - 1] if i else None
+
+    def newest(self):
+        """Return the version of the most recently created tag, which isn't
+        the highest one if an older line got a release afterwards, or
+        **None**."""
+
+        return self._newest
+
+    def latest(self, stage=None):
+        """Return the highest version, of the given ``stage`` if any, or
+        **None**."""
+
+        if stage is None:
+            versions = self._versions
+        else:
+            versions = self._stages.get(stage, ((), ()))[1]
+
+        return versions[-1] if versions else None
+
+    def previous_final(self, version):
+        """Return the highest final version lower than ``version``, or
+        **None**."""
+
+        keys, versions = self._stages.get("final", ((), ()))
+        i = bisect_left(keys, version._number)
+
+        return versions[i - 1] if i else None
+
+
+def top_versions(versions, k, unique=True):
+    """Return the ``k`` highest versions, highest first, in O(n log k).
+
+    If ``unique`` is set, versions equal to a previous one are discarded, so
+    with tags listed newest first, each version keeps its newest tag.
+    """
+
+    if unique:
+        versions = dict.fromkeys(versions)
+
+    return heapq.nlargest(k, versions, key=attrgetter("_number"))
+
+
 def get_next_version(current, bump_to=None, stage=None):
 
     if current.stage != "final":
@@ -0,0 +1,157 @@
+import asyncio
+import sys
+import pytest
+from pathlib import Path
+from subprocess import run, CalledProcessError
+from braulio.async_git import (
+    AsyncGit,
+    async_commit_analyzer,
+    async_tag_analyzer,
+    gather_bounded,
+    _stream_command,
+)
+from braulio.git import Tag
+from braulio.version import Version
+
+
+def run_async(coroutine):
+    loop = asyncio.new_event_loop()
+
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def create_repository(path, messages):
+    path.mkdir()
+    run(["git", "init", "-q"], cwd=str(path), check=True)
+    run(["git", "config", "user.name", "A"], cwd=str(path), check=True)
+    run(["git", "config", "user.email", "a@a.test"], cwd=str(path), check=True)
+
+    for message in messages:
+        command = ["git", "commit", "-q", "--allow-empty", "-m", message]
+        run(command, cwd=str(path), check=True)
+
+
+@pytest.fixture
+def repositories(tmpdir):
+    paths = []
+
+    for name in ["one", "two", "three"]:
+        path = Path(tmpdir) / name
+        messages = [f"Add {name}\n\n!feat:{name}", f"Fix {name}\n\n!fix:{name}"]
+        create_repository(path, messages)
+        paths.append(path)
+
+    return paths
+
+
+class TestStreamCommand:
+    def test_non_zero_exit_code(self, tmpdir):
+        async def consume():
+            return [r async for r in _stream_command(["git", "log"], cwd=str(tmpdir))]
+
+        with pytest.raises(CalledProcessError):
+            run_async(consume())
+
+    def test_large_stderr(self):
+        # More warnings than a pipe can hold, written before the output
+        code = "import sys; sys.stderr.write('w' * 2 ** 20); print('a'); exit(1)"
+        records = []
+
+        async def consume():
+            async for record in _stream_command([sys.executable, "-c", code]):
+                records.append(record)
+
+        with pytest.raises(CalledProcessError) as excinfo:
+            run_async(consume())
+
+        assert records == ["a"]
+        assert len(excinfo.value.stderr) == 2 ** 20
+
+    def test_stop_before_the_end(self, repositories):
+        async def first():
+            records = _stream_command(["git", "log"], cwd=str(repositories[0]))
+
+            async for record in records:
+                await records.aclose()
+                return record
+
+        assert run_async(first()).startswith("commit ")
+
+
+class TestAsyncGit:
+    def test_log(self, repositories):
+        commits = run_async(AsyncGit(repositories[0]).log())
+
+        assert [c.header for c in commits] == ["Fix one", "Add one"]
+        assert [c.footer for c in commits] == ["!fix:one", "!feat:one"]
+
+    def test_tag(self, repositories):
+        git = AsyncGit(repositories[0])
+
+        assert run_async(git.tag()) == []
+
+        run_async(git.tag("v1.0.0"))
+        tags = run_async(git.tag())
+
+        assert [tag.name for tag in tags] == ["v1.0.0"]
+
+    def test_add_and_commit(self, repositories):
+        path = repositories[0]
+        git = AsyncGit(path)
+        (path / "file.py").write_text("")
+
+        with pytest.raises(FileNotFoundError):
+            run_async(git.add("missing.py"))
+
+        run_async(git.commit("Add file", files=["file.py"]))
+        commits = run_async(git.log())
+
+        assert "Add file" in commits[0].header
+
+
+def test_async_commit_analyzer(repositories):
+    git = AsyncGit(repositories[1])
+    analysis = async_commit_analyzer(git.iter_log(), "!{type}:{scope}")
+    semantic_commits = run_async(analysis)
+
+    assert [(sc.type, sc.scope) for sc in semantic_commits] == [
+        ("fix", "two"),
+        ("feat", "two"),
+    ]
+
+
+def test_async_tag_analyzer():
+    tags = [Tag("2016-10-15   v10.0.1"), Tag("2016-05-06   save-point")]
+
+    async def get_tags():
+        return tags
+
+    versions = run_async(async_tag_analyzer(get_tags(), "v{version}", Version))
+
+    assert versions == [Version("10.0.1")]
+    assert versions[0].tag is tags[0]
+
+
+def test_gather_bounded(repositories):
+    running = 0
+    max_running = 0
+
+    async def analyze(path):
+        nonlocal running, max_running
+
+        running += 1
+        max_running = max(max_running, running)
+
+        commits = AsyncGit(path).iter_log()
+        result = await async_commit_analyzer(commits, "!{type}:{scope}")
+
+        running -= 1
+        return result
+
+    results = run_async(gather_bounded([analyze(p) for p in repositories], 2))
+
+    assert max_running == 2
+    assert [lst[0].scope for lst in results] == ["one", "two", "three"]
@@ -0,0 +1,45 @@
+import pytest
+from pathlib import Path
+from unittest.mock import patch, ANY
+from braulio.cache import TagCache
+from braulio.git import Tag, tag_analyzer, _tag_version
+from braulio.version import Version
+
+
+parametrize = pytest.mark.parametrize
+
+
+def test_tag_cache(tmpdir):
+    path = Path(tmpdir) / "braulio" / "tags.json"
+    tags = [Tag("2018-05-06   v1.0.0"), Tag("2018-04-01   save-point")]
+    cache = TagCache(path, "v{version}", Version)
+
+    assert cache.watermark is None
+    assert tag_analyzer(tags, "v{version}", Version, cache=cache) == [Version("1.0.0")]
+    cache.save(tags, [1, 2])
+
+    cache = TagCache(path, "v{version}", Version)
+
+    assert cache.watermark == [1, 2]
+    assert [tag.text for tag in cache.tags] == [tag.text for tag in tags]
+    assert cache.get("v1.0.0") == Version("1.0.0")
+    assert cache.get("save-point") is None
+
+    # Only the new tag is analyzed, the removed one is dropped
+    tags = [Tag("2018-06-01   v1.1.0"), tags[0]]
+
+    with patch("braulio.git._tag_version", wraps=_tag_version) as mock:
+        versions = tag_analyzer(tags, "v{version}", Version, cache=cache)
+
+    assert versions == [Version("1.1.0"), Version("1.0.0")]
+    assert versions[1].tag is tags[1]
+    mock.assert_called_once_with(ANY, tags[0], Version)
+
+    cache.save(tags, [1, 3])
+    cache = TagCache(path, "v{version}", Version)
+
+    assert len(cache) == 2
+    assert "save-point" not in cache
+
+    # A different tag pattern discards the entries
+    assert len(TagCache(path, "release-{version}", Version)) == 0
@@ -1,9 +1,10 @@
+import os
 import pytest
-from unittest.mock import patch
-from collections import namedtuple
+from unittest.mock import ANY, patch
+from collections import OrderedDict, namedtuple
 from datetime import date
 from pathlib import Path
-from braulio.version import Version
+from braulio.version import Stage, Version
 from braulio.git import commit_analyzer
 from braulio.files import (
     DEFAULT_CHANGELOG,
@@ -14,7 +15,11 @@ from braulio.files import (
     _render_release,
     update_chglog,
     update_files,
+    update_version_files,
+    ChangelogIndex,
+    FileTransaction,
     is_title,
+    find_titles,
     _split_chglog,
     ReleaseDataTree,
 )
@@ -168,6 +173,26 @@ def test_is_title(first, second, third, expected):
     assert is_title(first, second, third) is expected
 
 
+@parametrize(
+    "content, expected",
+    [
+        (b"Title\n=====\n", [(0, 12, b"Title")]),
+        (b"Text\n\nTitle\n-----\n\nText\n", [(6, 18, b"Title")]),
+        (b"-----\nTitle\n-----\n\n", [(0, 18, b"Title")]),
+        (b"\r\nTitle\r\n-----\r\n", [(2, 16, b"Title")]),
+        # The underline is also the overline of the next title
+        (b"A\n-\nB\n-\n", [(0, 4, b"A"), (2, 8, b"B")]),
+        (b"Text\nTitle\n-----\n", []),
+        (b"\nTitle\n---\n", []),
+        (b"---\nTitle\n-----\n", []),
+        (b"\nTitle\n-----", []),
+        (b"", []),
+    ],
+)
+def test_find_titles(content, expected):
+    assert list(find_titles(content)) == expected
+
+
 rst_file1 = """
 .. currentmodule:: mymodule
 
@@ -369,6 +394,132 @@ def test_remove_block_from_changelog(isolated_filesystem):
         assert "line 6" in text
 
 
+def test_remove_block_until_the_end(isolated_filesystem):
+    with isolated_filesystem:
+        path = Path.cwd() / "CHANGELOG.rst"
+        path.write_text("line 1\n" "line 2\n" "line 3\n")
+
+        update_chglog(path, Version("1.0.0"), Version("2.0.0"), {}, ["line 2"])
+
+        assert path.read_text() == "line 1\n"
+
+
+merge_pre_changelog = (
+    "History\n"
+    "=======\n"
+    "\n"
+    "1.1.0beta2 (2018-01-05)\n"
+    "-----------------------\n"
+    "\n"
+    "* Beta 2\n"
+    "\n"
+    "1.1.0beta1 (2018-01-04)\n"
+    "-----------------------\n"
+    "\n"
+    "* Beta 1\n"
+    "\n"
+    "1.0.0 (2018-01-01)\n"
+    "------------------\n"
+    "\n"
+    "* First release\n"
+)
+
+
+@parametrize("indexed", [False, True], ids=["scan", "index"])
+@parametrize(
+    "remove, expected",
+    [
+        (
+            ["1.1.0beta2", "1.0.0"],
+            (
+                "History\n"
+                "=======\n"
+                "\n"
+                "1.1.0 (2018-01-06)\n"
+                "------------------\n"
+                "\n"
+                "* All\n"
+                "\n"
+                "1.0.0 (2018-01-01)\n"
+                "------------------\n"
+                "\n"
+                "* First release\n"
+            ),
+        ),
+        (
+            ["1.1.0beta2"],
+            (
+                "History\n"
+                "=======\n"
+                "\n"
+                "1.1.0 (2018-01-06)\n"
+                "------------------\n"
+                "\n"
+                "* All\n"
+                "\n"
+            ),
+        ),
+        (
+            None,
+            merge_pre_changelog.replace(
+                "\n\n1.1.0beta2", "\n\n1.1.0 (2018-01-06)\n------------------\n"
+                "\n* All\n\n1.1.0beta2"
+            ),
+        ),
+    ],
+    ids=["Until the previous final", "Until the end", "Nothing removed"],
+)
+@patch(
+    "braulio.files._render_release",
+    return_value="1.1.0 (2018-01-06)\n------------------\n\n* All\n\n",
+)
+def test_update_chglog_merge_pre(
+    mock_render_release, isolated_filesystem, remove, expected, indexed
+):
+    # Same output, byte by byte, as the update made in several passes
+    # before, which failed if there was no previous final release
+    stages = OrderedDict(
+        beta=Stage("beta", "{major}.{minor}.{patch}beta{n}"),
+        final=Stage("final", "{major}.{minor}.{patch}"),
+    )
+
+    with isolated_filesystem, patch.object(Version, "stages", stages):
+        path = Path("HISTORY.rst")
+        path.write_text(merge_pre_changelog)
+        index = ChangelogIndex.build(path) if indexed else None
+
+        rewrite = FileTransaction.rewrite
+
+        with patch.object(
+            FileTransaction, "rewrite", autospec=True, side_effect=rewrite
+        ) as mock_rewrite:
+            update_chglog(
+                path, Version("1.1.0beta2"), Version("1.1.0"), {}, remove, index=index
+            )
+
+        # The file is written once
+        assert mock_rewrite.call_count == 1
+        assert path.read_bytes() == expected.encode()
+
+
+@patch("braulio.files._render_release", return_value="2.0.0\n-----\n\n")
+def test_update_chglog_streaming(mock_render_release, isolated_filesystem):
+    sections = "".join(f"0.{i}.0\n-----\n\n* Change {i}\n\n" for i in range(5000))
+
+    with isolated_filesystem:
+        path = Path.cwd() / "CHANGELOG.rst"
+        path.write_text("History\n=======\n\n1.0.0\n-----\n\n" + sections)
+        path.chmod(0o640)
+
+        update_chglog(path, Version("1.0.0"), Version("2.0.0"), {})
+
+        assert path.read_text() == (
+            "History\n=======\n\n2.0.0\n-----\n\n1.0.0\n-----\n\n" + sections
+        )
+        assert path.stat().st_mode & 0o777 == 0o640
+        assert os.listdir(".") == ["CHANGELOG.rst"]
+
+
 class Test_update_files:
     def test_files_missing_version_string(self, fake_repository):
         paths = ["setup.py", "black/__init__.py"]
@@ -379,6 +530,39 @@ class Test_update_files:
             with pytest.raises(ValueError, match=message):
                 update_files(paths, "4.0.0", "4.1.0")
 
+    def test_files_missing_version_string_rollback(self, fake_repository):
+        paths = ["black/__init__.py", "HISTORY.rst"]
+
+        with fake_repository("black"):
+            before = Path("black/__init__.py").read_text()
+
+            with pytest.raises(ValueError):
+                update_files(paths, "4.1.3", "5.0.0")
+
+            assert Path("black/__init__.py").read_text() == before
+            assert not [name for name in os.listdir("black") if name[0] == "."]
+
+    @parametrize("max_workers", [None, 4])
+    def test_files_missing_version_string_report(self, fake_repository, max_workers):
+        paths = ["HISTORY.rst", "black/__init__.py", "setup.py"]
+
+        with fake_repository("black"):
+            with pytest.raises(ValueError) as e:
+                update_files(paths, "4.1.3", "5.0.0", max_workers=max_workers)
+
+            assert str(e.value) == (
+                'Unable to find a version string to update in "HISTORY.rst"'
+            )
+
+            with pytest.raises(ValueError) as e:
+                update_files(paths, "4.0.0", "5.0.0", max_workers=max_workers)
+
+            # All the files, in the given order
+            assert str(e.value).splitlines() == [
+                f'Unable to find a version string to update in "{path}"'
+                for path in paths
+            ]
+
     def test_file_update(self, fake_repository):
         paths = ["setup.py", "black/__init__.py"]
 
@@ -415,3 +599,318 @@ class Test_update_files:
             "def example():\n"
             "    pass\n"
         )
+
+
+@parametrize("workers", [None, 4])
+def test_update_version_files(fake_repository, workers):
+    paths = ["black/__init__.py", "HISTORY.rst", "setup.py", "MISSING.py"]
+
+    with fake_repository("black"):
+        with FileTransaction() as transaction:
+            report = update_version_files(
+                paths, "4.1.3", "5.0.0", transaction, workers=workers
+            )
+
+        assert [(update.path, update.count) for update in report] == [
+            (Path("black/__init__.py"), 1),
+            (Path("HISTORY.rst"), 0),
+            (Path("setup.py"), 1),
+            (Path("MISSING.py"), 0),
+        ]
+        assert [type(update.error) for update in report] == [
+            type(None),
+            type(None),
+            type(None),
+            FileNotFoundError,
+        ]
+        assert "version='5.0.0'" in Path("setup.py").read_text()
+
+
+@patch("braulio.files.MMAP_THRESHOLD", 1)
+def test_update_version_files_mapped(isolated_filesystem):
+    with isolated_filesystem:
+        path = Path("version.py")
+        path.write_bytes(b"# 1.0.0\r\nversion = '1.0.0'\r\n")
+
+        with FileTransaction() as transaction:
+            report = update_version_files([path], "1.0.0", "1.1.0", transaction)
+
+        assert report[0].count == 1
+        # Only the version string is changed, line breaks included
+        assert path.read_bytes() == b"# 1.0.0\r\nversion = '1.1.0'\r\n"
+
+
+class TestFileTransaction:
+    def write(self, transaction, path, text):
+        with transaction.rewrite(path) as (src, dst):
+            dst.write(src.read() + text)
+
+    def test_commit(self, isolated_filesystem):
+        with isolated_filesystem:
+            Path("a.txt").write_text("a")
+            Path("b.txt").write_text("b")
+
+            with FileTransaction() as transaction:
+                self.write(transaction, "a.txt", "1")
+                self.write(transaction, "b.txt", "1")
+
+                # Nothing is replaced until the transaction is committed
+                assert Path("a.txt").read_text() == "a"
+
+                # Later rewrites start from the previous ones
+                self.write(transaction, "a.txt", "2")
+
+            assert Path("a.txt").read_text() == "a12"
+            assert Path("b.txt").read_text() == "b1"
+            assert sorted(os.listdir(".")) == ["a.txt", "b.txt"]
+
+    def test_rollback(self, isolated_filesystem):
+        with isolated_filesystem:
+            Path("a.txt").write_text("a")
+
+            with pytest.raises(RuntimeError):
+                with FileTransaction() as transaction:
+                    self.write(transaction, "a.txt", "1")
+                    raise RuntimeError
+
+            assert Path("a.txt").read_text() == "a"
+            assert os.listdir(".") == ["a.txt"]
+
+    def test_failed_replace(self, isolated_filesystem):
+        replace = os.replace
+
+        def fail_on_b(src, dst):
+            if dst.endswith("b.txt"):
+                raise OSError("Disk full")
+
+            return replace(src, dst)
+
+        with isolated_filesystem:
+            Path("a.txt").write_text("a")
+            Path("b.txt").write_text("b")
+
+            transaction = FileTransaction()
+            self.write(transaction, "a.txt", "1")
+            self.write(transaction, "b.txt", "1")
+
+            with patch("braulio.files.os.replace", side_effect=fail_on_b):
+                with pytest.raises(OSError):
+                    transaction.commit()
+
+            assert Path("a.txt").read_text() == "a"
+            assert Path("b.txt").read_text() == "b"
+            assert sorted(os.listdir(".")) == ["a.txt", "b.txt"]
+
+    def test_symlink(self, isolated_filesystem):
+        with isolated_filesystem:
+            os.mkdir("pkg")
+            Path("real.py").write_text("a")
+            os.symlink("../real.py", "pkg/v.py")
+
+            with FileTransaction() as transaction:
+                self.write(transaction, "pkg/v.py", "1")
+                # The link and its target are the same file
+                self.write(transaction, "real.py", "2")
+
+                assert "pkg/v.py" in transaction
+
+            assert os.readlink("pkg/v.py") == "../real.py"
+            assert Path("real.py").read_text() == "a12"
+            assert os.listdir("pkg") == ["v.py"]
+            assert sorted(os.listdir(".")) == ["pkg", "real.py"]
+
+
+@parametrize("indexed", [False, True])
+@patch("braulio.files._render_release", return_value="New Content\n")
+def test_update_chglog_symlink(mock_render_release, isolated_filesystem, indexed):
+    with isolated_filesystem:
+        Path("HISTORY.rst").write_text("History\n=======\n\n1.0.0\n-----\n")
+        os.symlink("HISTORY.rst", "CHANGELOG.rst")
+        path = Path("CHANGELOG.rst")
+        index = ChangelogIndex.build(path) if indexed else None
+
+        update_chglog(path, Version("1.0.0"), Version("2.0.0"), {}, index=index)
+
+        assert path.is_symlink()
+        assert Path("HISTORY.rst").read_text() == (
+            "History\n=======\n\nNew Content\n1.0.0\n-----\n"
+        )
+
+
+@parametrize("indexed", [False, True])
+@patch("braulio.files._render_release", return_value="2.0.0\n-----\n\n")
+def test_update_chglog_crlf(mock_render_release, isolated_filesystem, indexed):
+    with isolated_filesystem:
+        path = Path("HISTORY.rst")
+        path.write_bytes(b"History\r\n=======\r\n\r\n1.0.0\r\n-----\r\n")
+        index = ChangelogIndex.build(path) if indexed else None
+
+        update_chglog(path, Version("1.0.0"), Version("2.0.0"), {}, index=index)
+
+        assert path.read_bytes() == (
+            b"History\r\n=======\r\n\r\n"
+            b"2.0.0\r\n-----\r\n\r\n"
+            b"1.0.0\r\n-----\r\n"
+        )
+
+        if indexed:
+            index.save(Path("index.json"))
+            index = ChangelogIndex.load(path, Path("index.json"))
+
+            assert index.sections == ChangelogIndex.build(path).sections
+
+
+@patch("braulio.files._render_release", return_value="2.0.0\n-----\n\n")
+def test_update_chglog_crlf_rewrite(mock_render_release, isolated_filesystem):
+    with isolated_filesystem:
+        # Titles that don't start with the version are rewritten line by line
+        path = Path("HISTORY.rst")
+        path.write_bytes(
+            b"History\r\n=======\r\n\r\nRelease 1.0.0\r\n-------------\r\n"
+        )
+
+        rewrite = FileTransaction.rewrite
+
+        with patch.object(
+            FileTransaction, "rewrite", autospec=True, side_effect=rewrite
+        ) as mock_rewrite:
+            update_chglog(path, Version("1.0.0"), Version("2.0.0"), {})
+
+        mock_rewrite.assert_called_once_with(ANY, path, newline="\r\n")
+        assert path.read_bytes() == (
+            b"History\r\n=======\r\n\r\n"
+            b"2.0.0\r\n-----\r\n\r\n"
+            b"Release 1.0.0\r\n-------------\r\n"
+        )
+
+
+class TestChangelogIndex:
+    changelog = (
+        "History\n"
+        "=======\n"
+        "\n"
+        "1.1.0 (2018-01-03)\n"
+        "------------------\n"
+        "\n"
+        "Bug Fixes\n"
+        "~~~~~~~~~\n"
+        "\n"
+        "* Fix a bug\n"
+        "\n"
+        "------------------\n"
+        "1.0.0 (2018-01-02)\n"
+        "------------------\n"
+        "\n"
+        "* Add a feature\n"
+        "\n"
+        "0.1.0 (2018-01-01)\n"
+        "------------------\n"
+        "\n"
+        "* First release\n"
+    )
+
+    def test_build(self, isolated_filesystem):
+        with isolated_filesystem:
+            path = Path("HISTORY.rst")
+            path.write_text(self.changelog)
+
+            index = ChangelogIndex.build(path)
+
+            # Titles that don't start with a version aren't sections
+            assert [version for version, _ in index.sections] == [
+                "1.1.0",
+                "1.0.0",
+                "0.1.0",
+            ]
+            assert "History" not in index
+            assert index.is_valid()
+
+            assert index.read_section("1.1.0") == (
+                "1.1.0 (2018-01-03)\n"
+                "------------------\n"
+                "\n"
+                "Bug Fixes\n"
+                "~~~~~~~~~\n"
+                "\n"
+                "* Fix a bug\n"
+                "\n"
+            )
+
+            # The overline belongs to the section
+            assert index.read_section("1.0.0").startswith("-----")
+            assert index.read_section("0.1.0") == (
+                "0.1.0 (2018-01-01)\n------------------\n\n* First release\n"
+            )
+
+    def test_save_and_load(self, isolated_filesystem):
+        with isolated_filesystem:
+            path = Path("HISTORY.rst")
+            path.write_text(self.changelog)
+            index_path = Path("index.json")
+
+            ChangelogIndex.build(path).save(index_path)
+            index = ChangelogIndex.load(path, index_path)
+
+            assert index.sections == ChangelogIndex.build(path).sections
+
+            # The file changed since the index was saved
+            with path.open("a") as f:
+                f.write("\n")
+
+            assert ChangelogIndex.load(path, index_path) is None
+            assert ChangelogIndex.open(path, index_path).size == path.stat().st_size
+
+    @parametrize(
+        "remove, expected",
+        [
+            (None, ["2.0.0", "1.1.0", "1.0.0", "0.1.0"]),
+            (["1.1.0", "1.0.0"], ["2.0.0", "1.0.0", "0.1.0"]),
+            (["1.1.0"], ["2.0.0"]),
+        ],
+    )
+    @patch("braulio.files._render_release", return_value="2.0.0\n-----\n\n")
+    def test_update_chglog(
+        self, mock_render_release, isolated_filesystem, remove, expected
+    ):
+        with isolated_filesystem:
+            path = Path("HISTORY.rst")
+            path.write_text(self.changelog)
+            Path("expected.rst").write_text(self.changelog)
+
+            index = ChangelogIndex.build(path)
+            update_chglog(
+                path, Version("1.1.0"), Version("2.0.0"), {}, remove, index=index
+            )
+
+            # Same as the update without an index
+            update_chglog(
+                Path("expected.rst"), Version("1.1.0"), Version("2.0.0"), {}, remove
+            )
+
+            assert path.read_text() == Path("expected.rst").read_text()
+
+            # The index is updated, not rebuilt
+            assert [version for version, _ in index.sections] == expected
+
+            index.save(Path("index.json"))
+            index = ChangelogIndex.load(path, Path("index.json"))
+
+            assert index.sections == ChangelogIndex.build(path).sections
+
+    @patch("braulio.files._render_release", return_value="2.0.0\n-----\n\n")
+    def test_update_chglog_without_section(
+        self, mock_render_release, isolated_filesystem
+    ):
+        with isolated_filesystem:
+            path = Path("HISTORY.rst")
+            path.write_text(self.changelog)
+
+            index = ChangelogIndex.build(path)
+            update_chglog(path, Version("3.0.0"), Version("4.0.0"), {}, index=index)
+
+            assert path.read_text() == self.changelog + "2.0.0\n-----\n\n"
+
+            # The index is outdated, so it is never saved
+            index.save(Path("index.json"))
+
+            assert not Path("index.json").exists()
@@ -1,9 +1,25 @@
+import sys
 import pytest
 from collections import namedtuple
-from subprocess import CalledProcessError, PIPE
+from pathlib import Path
+from subprocess import run, CalledProcessError, PIPE
 from unittest.mock import patch
-from braulio.git import _run_command, Git, Commit, Tag, commit_analyzer, tag_analyzer
+from braulio.git import (
+    _run_command,
+    _stream_command,
+    git_dir,
+    GitSession,
+    Git,
+    Commit,
+    Tag,
+    LabelMatcher,
+    get_label_matcher,
+    commit_analyzer,
+    tag_analyzer,
+    _batch_tag_versions,
+)
 from braulio.version import Version
+from braulio.cache import TagCache
 
 
 parametrize = pytest.mark.parametrize
@@ -27,6 +43,124 @@ class TestRunCommand:
                 _run_command(["git", "status"])
 
 
+class TestStreamCommand:
+    def test_output_lines(self):
+        lines = list(_stream_command(["git", "--version"]))
+
+        assert len(lines) == 1
+        assert lines[0].startswith("git version")
+
+    @parametrize("chunk_size", [1, 3, 65536])
+    def test_custom_separator(self, chunk_size):
+        command = [sys.executable, "-c", "print('a\\0bc\\0\\0d', end='\\0')"]
+        records = _stream_command(command, separator=b"\0", chunk_size=chunk_size)
+
+        assert list(records) == ["a", "bc", "", "d"]
+
+    def test_non_zero_exit_code(self, isolated_filesystem):
+        with isolated_filesystem:
+            with pytest.raises(CalledProcessError):
+                list(_stream_command(["git", "status"]))
+
+    def test_large_stderr(self):
+        # More warnings than a pipe can hold, written before the output
+        code = "import sys; sys.stderr.write('w' * 2 ** 20); print('a'); exit(1)"
+
+        with pytest.raises(CalledProcessError) as excinfo:
+            assert list(_stream_command([sys.executable, "-c", code])) == ["a"]
+
+        assert len(excinfo.value.stderr) == 2 ** 20
+
+
+def test_git_dir(isolated_filesystem):
+    with isolated_filesystem:
+        assert git_dir() is None
+
+        run(["git", "init", "-q"], check=True)
+
+        assert git_dir() == Path.cwd() / ".git"
+
+
+def git_commit(message):
+    command = ["git", "-c", "user.name=A", "-c", "user.email=a@a.test", "commit"]
+    run(command + ["-q", "--allow-empty", "-m", message], check=True)
+
+
+class TestGitSession:
+    def test_resolve(self, isolated_filesystem):
+        with isolated_filesystem:
+            run(["git", "init", "-q"], check=True)
+            git_commit("Add a thing")
+
+            with GitSession() as session:
+                commit_hash, object_type, size = session.resolve("HEAD")
+                assert len(commit_hash) == 40
+                assert object_type == "commit"
+                assert size > 0
+
+                assert session.resolve("HEAD~1") is None
+                assert session.resolve(commit_hash)[0] == commit_hash
+
+    def test_read_object(self, isolated_filesystem):
+        with isolated_filesystem:
+            run(["git", "init", "-q"], check=True)
+            git_commit("Add a thing")
+
+            with GitSession() as session:
+                commit_hash, object_type, data = session.read_object("HEAD")
+                assert object_type == "commit"
+                assert data.startswith(b"tree ")
+                assert data.endswith(b"\n\nAdd a thing\n")
+
+                # The stream is still in sync after reading the contents
+                assert session.read_object("HEAD")[2] == data
+                assert session.read_object("nope") is None
+
+    def test_close(self, isolated_filesystem):
+        with isolated_filesystem:
+            run(["git", "init", "-q"], check=True)
+            git_commit("Add a thing")
+
+            session = GitSession()
+            session.resolve("HEAD")
+            process = session._processes["--batch-check"]
+            session.close()
+
+            assert process.returncode == 0
+            assert session._processes == {}
+
+    def test_outside_repository(self, isolated_filesystem):
+        with isolated_filesystem:
+            with GitSession() as session:
+                with pytest.raises(CalledProcessError):
+                    session.resolve("HEAD")
+
+
+class TestGitReads:
+    def test_rev_parse(self, isolated_filesystem):
+        with isolated_filesystem:
+            run(["git", "init", "-q"], check=True)
+            git_commit("Add a thing")
+            expected = _run_command(["git", "rev-parse", "HEAD"]).strip()
+
+            with Git() as git:
+                assert git.rev_parse("HEAD") == expected
+                assert git.rev_parse("v1.0.0") is None
+
+    def test_read_commit(self, isolated_filesystem):
+        with isolated_filesystem:
+            run(["git", "init", "-q"], check=True)
+            git_commit("Add a thing\n\nLorem ipsum\n\n!feat:cli")
+
+            with Git() as git:
+                commit = git.read_commit("HEAD")
+                assert git.read_commit("HEAD~1") is None
+
+        assert commit.header == "Add a thing"
+        assert commit.body == "Lorem ipsum\n\n!feat:cli"
+        assert commit.footer == "!feat:cli"
+
+
 class TestTag:
     @parametrize(
         "text, date, name",
@@ -42,6 +176,9 @@ class TestTag:
         assert tag.name == name
         assert tag.date == date
 
+    def test_slots(self):
+        assert not hasattr(Tag("2015-10-15  v10.0.1"), "__dict__")
+
     def test_str(self):
         tag = Tag("2015-10-15  v10.0.1")
         assert str(tag) == "v10.0.1"
@@ -52,6 +189,10 @@ class TestTag:
 
 
 class TestCommitClass:
+    def test_slots(self, commit_text_registry):
+        commit = Commit(commit_text_registry["eaedb93"])
+        assert not hasattr(commit, "__dict__")
+
     @parametrize(
         "short_hash, expected",
         [
@@ -224,6 +365,74 @@ class TestGitLog:
         mocked_run_command.assert_called_with(["git", "log"] + revision_range)
 
 
+class TestGitIterLog:
+    @patch("braulio.git._stream_command", autospec=True)
+    def test_iter_all_commits(self, mocked_stream_command, commit_list):
+        fields = []
+
+        for commit in commit_list:
+            fields.extend([commit.hash, commit.message + "\n"])
+
+        mocked_stream_command.return_value = iter(fields)
+
+        git = Git()
+        commits = git.iter_log()
+
+        assert not isinstance(commits, list)
+
+        commits = list(commits)
+
+        mocked_stream_command.assert_called_with(
+            ["git", "log", "-z", "--format=%H%x00%B"], separator=b"\0"
+        )
+        assert len(commits) == 12
+
+        for commit, expected in zip(commits, commit_list):
+            assert commit.hash == expected.hash
+            assert commit.message == expected.message
+            assert commit.header == expected.header
+            assert commit.footer == expected.footer
+            assert commit.body == expected.body
+
+    def test_commit_line_in_message_body(self, isolated_filesystem):
+        message = (
+            "Quote a commit\n\n"
+            "commit eaedb9320c7aad581daa05f1510b64393c082dbb\n\n"
+            "!fix:thing"
+        )
+
+        with isolated_filesystem:
+            run(["git", "init", "-q"], check=True)
+            git_commit(message)
+
+            commits = list(Git().iter_log())
+
+        assert len(commits) == 1
+        assert commits[0].header == "Quote a commit"
+        assert commits[0].footer == "!fix:thing"
+        assert commits[0].message == message
+
+    @parametrize(
+        "f, t, revision_range",
+        [
+            (None, None, []),
+            (None, "tag2", []),
+            ("tag1", None, ["tag1..HEAD"]),
+            ("tag1", "tag2", ["tag1..tag2"]),
+        ],
+    )
+    @patch("braulio.git._stream_command", return_value=iter([]), autospec=True)
+    def test_log_range(self, mocked_stream_command, f, t, revision_range):
+
+        git = Git()
+        list(git.iter_log(_from=f, to=t))
+
+        mocked_stream_command.assert_called_with(
+            ["git", "log"] + revision_range + ["-z", "--format=%H%x00%B"],
+            separator=b"\0",
+        )
+
+
 git_tag_output = (
     "2015-10-15      v0.0.1\n"
     "2015-11-18      v0.0.2\n"
@@ -275,6 +484,63 @@ class TestGitTag:
         )
 
 
+class TestLabelMatcher:
+
+    Commit = namedtuple("Commit", ["header", "footer", "message"])
+
+    def test_memoized_matchers(self):
+        matcher = get_label_matcher("!{type}:{scope}", "footer")
+
+        assert isinstance(matcher, LabelMatcher)
+        assert get_label_matcher("!{type}:{scope}", "footer") is matcher
+        assert get_label_matcher("!{type}:{scope}", "header") is not matcher
+
+    @parametrize(
+        "label_pattern, label_position",
+        [("!{type}:{scope}", "footer"), ("{type}({scope}): {subject}", "header")],
+    )
+    def test_match_many(self, label_pattern, label_position):
+        commits = [
+            self.Commit(header="fix(cli): Fix it", footer="!fix:cli", message=""),
+            self.Commit(header="Lorem ipsum", footer="Dolor sit amet", message=""),
+            self.Commit(header="feat(): Add it", footer="!feat:", message=""),
+        ]
+
+        matcher = LabelMatcher(label_pattern, label_position)
+        lst = matcher.match_many(commits)
+
+        assert [(sc.type, sc.scope) for sc in lst] == [("fix", "cli"), ("feat", None)]
+        assert matcher.match(commits[1]) is None
+
+    def test_multiple_conventions(self):
+        Commit = namedtuple("Commit", ["header", "footer", "message"])
+        commits = [
+            Commit(header="fix(cli): Fix it", footer="Lorem", message=""),
+            Commit(header="Add it", footer="!feat:core", message=""),
+            Commit(header="Refactor it", footer="Type: refactor", message=""),
+            Commit(header="Lorem ipsum", footer="Dolor sit amet", message=""),
+        ]
+
+        matcher = LabelMatcher(
+            [
+                ("{type}({scope}): {subject}", "header"),
+                "!{type}:{scope}",
+                "Type: {type}",
+            ],
+            label_position="footer",
+        )
+
+        lst = matcher.match_many(commits)
+
+        assert [(sc.type, sc.scope, sc.subject, sc.convention) for sc in lst] == [
+            ("fix", "cli", "Fix it", "{type}({scope}): {subject}"),
+            ("feat", "core", "Add it", "!{type}:{scope}"),
+            ("refactor", None, "Refactor it", "Type: {type}"),
+        ]
+
+        assert len(matcher._searchers) == 2
+
+
 class Test_commit_analyzer:
 
     # A substitution to braulio.git.Commit for test purpose
@@ -366,6 +632,40 @@ class Test_commit_analyzer:
             assert lst[0].scope is None
             assert lst[0].type == "fix"
 
+    def test_label_pattern_list(self):
+        commits = [
+            self.Commit(header="fix(cli): Fix it", footer="Lorem", message=""),
+            self.Commit(header="Add it", footer="!feat:core", message=""),
+        ]
+
+        lst = commit_analyzer(
+            commits, ["!{type}:{scope}", ["{type}({scope}): {subject}", "header"]]
+        )
+
+        assert [sc.type for sc in lst] == ["fix", "feat"]
+
+    def test_parallel_analysis(self, commit_list):
+        commits = commit_list * 5
+        expected = commit_analyzer(commits, "!{type}:{scope}")
+
+        with patch("braulio.git.CHUNK_SIZE", 7):
+            lst = commit_analyzer(
+                commits, "!{type}:{scope}", workers=2, parallel_threshold=10
+            )
+
+        assert lst == expected
+
+    @patch("braulio.git._parallel_analysis", autospec=True)
+    def test_serial_analysis_below_threshold(self, mocked_parallel_analysis):
+        commit = self.Commit(header="Make it work", footer="!fix:cli", message="")
+
+        lst = commit_analyzer(
+            iter([commit] * 9), "!{type}:{scope}", workers=2, parallel_threshold=10
+        )
+
+        assert len(lst) == 9
+        mocked_parallel_analysis.assert_not_called()
+
 
 def test_tag_analyzer():
 
@@ -381,3 +681,32 @@ def test_tag_analyzer():
     assert result == [Version("10.0.1"), Version("0.10.13"), Version("0.9.7")]
 
     assert result[0].tag.name == "v10.0.1"
+
+
+@parametrize("tag_pattern", ["v{version}", "release-{version}", "{version}"])
+def test_batch_tag_analyzer(tag_pattern):
+    names = ["0.1.0", "2.0.0", "1.0.0", "1.1", "save-point", "1.10.2-rc", "x1"]
+    tags = [Tag(f"2016-10-15   {tag_pattern.format(version=n)}") for n in names]
+    tags.insert(2, Tag("2016-10-15   other-3.0.0"))
+
+    expected = tag_analyzer(tags, tag_pattern, Version)
+    result = tag_analyzer(tags, tag_pattern, Version, batch=True)
+
+    assert result == sorted(expected, reverse=True)
+    assert [v.tag for v in result] == [v.tag for v in sorted(expected, reverse=True)]
+
+
+def test_batch_tag_analyzer_with_cache(tmpdir):
+    tags = [Tag("2016-10-15   v0.1.0"), Tag("2016-10-14   save-point")]
+    cache = TagCache(Path(tmpdir) / "tags.json", "v{version}", Version)
+
+    tag_analyzer(tags, "v{version}", Version, cache=cache, batch=True)
+    tags.insert(0, Tag("2016-10-16   v0.2.0"))
+
+    with patch("braulio.git._batch_tag_versions", wraps=_batch_tag_versions) as mock:
+        result = tag_analyzer(tags, "v{version}", Version, cache=cache, batch=True)
+
+    assert result == [Version("0.2.0"), Version("0.1.0")]
+    assert result[1].tag is tags[1]
+    assert mock.call_args[0][0] == [tags[0]]
+    assert cache.get("save-point") is None
@@ -0,0 +1,64 @@
+import os
+from subprocess import run
+from click.testing import CliRunner
+from braulio.cli import cli
+
+
+def git(*args):
+    run(("git",) + args, check=True)
+
+
+def test_maintenance(isolated_filesystem):
+    runner = CliRunner()
+
+    with isolated_filesystem:
+        git("init", "-q")
+        git("config", "user.name", "A")
+        git("config", "user.email", "a@a.test")
+        git("commit", "-q", "--allow-empty", "-m", "Initial commit")
+
+        result = runner.invoke(cli, ["maintenance"])
+
+        assert result.exit_code == 0
+        assert "Write commit-graph" in result.output
+
+        result = runner.invoke(cli, ["maintenance"])
+
+        assert result.exit_code == 0
+        assert "The commit-graph is up to date" in result.output
+
+        result = runner.invoke(cli, ["maintenance", "--force"])
+
+        assert "Write commit-graph" in result.output
+
+
+def test_maintenance_in_worktree(isolated_filesystem, tmpdir):
+    runner = CliRunner()
+
+    with isolated_filesystem:
+        git("init", "-q")
+        git("config", "user.name", "A")
+        git("config", "user.email", "a@a.test")
+        git("commit", "-q", "--allow-empty", "-m", "Initial commit")
+        git("worktree", "add", "-q", "worktree", "-b", "feature")
+        os.chdir("worktree")
+
+        result = runner.invoke(cli, ["maintenance"])
+
+        assert "Write commit-graph" in result.output
+        assert os.path.isfile("../.git/objects/info/commit-graph")
+
+        result = runner.invoke(cli, ["maintenance"])
+
+        assert result.exit_code == 0
+        assert "The commit-graph is up to date" in result.output
+
+
+def test_maintenance_outside_repository(isolated_filesystem):
+    runner = CliRunner()
+
+    with isolated_filesystem:
+        result = runner.invoke(cli, ["maintenance"])
+
+        assert result.exit_code == 1
+        assert "Not a git repository" in result.output
@@ -0,0 +1,496 @@
+import os
+import pytest
+import zlib
+from subprocess import run, PIPE
+from unittest.mock import patch
+from braulio.cli import _version_index
+from braulio.git import Git
+from braulio.version import Version
+from braulio.objects import (
+    CommitGraph,
+    ObjectStore,
+    commit_graph_is_stale,
+    find_git_dir,
+    refs_watermark,
+    walk_commits,
+    _apply_delta,
+)
+
+
+parametrize = pytest.mark.parametrize
+
+
+def git(*args, date=None):
+    env = dict(os.environ)
+
+    if date:
+        env["GIT_AUTHOR_DATE"] = env["GIT_COMMITTER_DATE"] = f"{date} +0000"
+
+    output = run(("git",) + args, stdout=PIPE, env=env, check=True).stdout
+    return output.decode()
+
+
+def build_history():
+    """Create a history with a merge in the current directory, where almost
+    every commit changes HISTORY.rst so the packfile contains deltas."""
+
+    git("init", "-q")
+    git("config", "user.name", "A")
+    git("config", "user.email", "a@a.test")
+
+    timestamp = 1500000000
+
+    def commit(message, filename="HISTORY.rst"):
+        nonlocal timestamp
+        timestamp += 60
+
+        with open(filename, "a") as f:
+            f.write(f"* {message}\n" * 20)
+
+        git("add", ".")
+        git("commit", "-q", "-m", message, date=str(timestamp))
+
+    commit("Initial commit")
+    commit("Add a thing\n\n!feat:thing")
+    git("tag", "-a", "v0.1.0", "-m", "Release")
+    commit("Fix a thing\n\n!fix:thing")
+
+    git("checkout", "-q", "-b", "feature")
+    commit("Add another thing\n\n!feat:another", "setup.py")
+    git("checkout", "-q", "-")
+    commit("Refactor a thing\n\n!refactor:thing")
+    git("merge", "-q", "--no-ff", "--no-edit", "feature", date=str(timestamp + 60))
+    git("tag", "v0.2.0")
+    commit("Fix the merge\n\n!fix:merge")
+
+
+@pytest.fixture
+def repository(fake_repository):
+    with fake_repository("black"):
+        build_history()
+        yield
+
+
+def all_objects():
+    output = git("cat-file", "--batch-all-objects", "--batch-check")
+    return [line.split()[:2] for line in output.strip().split("\n")]
+
+
+def test_find_git_dir(isolated_filesystem, tmpdir):
+    with isolated_filesystem:
+        assert find_git_dir() is None
+
+        git("init", "-q")
+        os.mkdir("folder")
+
+        assert find_git_dir("folder") == tmpdir / ".git"
+
+
+def test_apply_delta():
+    base = b"Lorem ipsum dolor sit amet"
+
+    # Copy "Lorem " from the base, insert "dolor", copy " sit amet"
+    delta = bytes([26, 20, 0x90, 6, 5]) + b"dolor" + bytes([0x91, 17, 9])
+
+    assert _apply_delta(base, delta) == b"Lorem dolor sit amet"
+
+
+@parametrize("packed", [False, True], ids=["loose", "packed"])
+def test_read_objects(repository, packed):
+    if packed:
+        git("gc", "-q", "--aggressive")
+        assert not any(name != "info" for name in _loose_dirs())
+
+        # Make sure delta resolution is exercised
+        pack_dir = ".git/objects/pack/"
+        idx = [name for name in os.listdir(pack_dir) if name.endswith(".idx")]
+        assert "chain length" in git("verify-pack", "-v", pack_dir + idx[0])
+
+    objects = all_objects()
+    assert len(objects) > 20
+
+    with ObjectStore(".git") as store:
+        for sha, object_type in objects:
+            expected = run(["git", "cat-file", object_type, sha], stdout=PIPE)
+
+            assert store.read_object(sha) == (sha, object_type, expected.stdout)
+
+        assert store.read_object("0" * 40) is None
+
+
+def _loose_dirs():
+    return [name for name in os.listdir(".git/objects") if name != "pack"]
+
+
+def test_loose_object_header(repository):
+    sha = git("rev-parse", "HEAD").strip()
+    path = f".git/objects/{sha[:2]}/{sha[2:]}"
+    data = zlib.decompress(open(path, "rb").read())
+
+    with ObjectStore(".git") as store:
+        assert data.endswith(store.read_object(sha)[2])
+
+
+@parametrize("packed", [False, True], ids=["loose", "packed"])
+def test_resolve(repository, packed):
+    if packed:
+        git("pack-refs", "--all")
+
+    branch = git("symbolic-ref", "--short", "HEAD").strip()
+
+    with ObjectStore(".git") as store:
+        for rev in ["HEAD", branch, "v0.1.0", "v0.2.0", "refs/heads/feature"]:
+            assert store.resolve(rev) == git("rev-parse", rev).strip()
+
+        assert store.resolve("v9.9.9") is None
+
+
+@parametrize("packed", [False, True], ids=["loose", "packed"])
+def test_tags(repository, packed):
+    git("tag", "save-point", "HEAD~2")
+    git("tag", "-a", "v0.3.0", "-m", "Release", date="1400000000 -0800")
+
+    if packed:
+        git("pack-refs", "--all")
+        # A loose reference takes precedence over a packed one
+        git("tag", "-f", "v0.2.0", "HEAD")
+
+    expected = Git().tag()
+
+    with ObjectStore(".git") as store:
+        tags = store.tags()
+        version_tags = store.tags(lambda name: name.startswith("v"))
+
+    assert [tag.text for tag in tags] == [tag.text for tag in expected]
+    # v0.1.0 was tagged now, so it is the newest one
+    assert [tag.name for tag in version_tags] == ["v0.1.0", "v0.2.0", "v0.3.0"]
+    assert version_tags[2].date == "2014-05-13"
+
+
+def test_git_version_tags(repository):
+    git("tag", "save-point")
+
+    tags = Git().version_tags("v{version}", Version)
+
+    assert [tag.name for tag in tags] == ["v0.1.0", "v0.2.0"]
+
+
+def test_refs_watermark(repository):
+    watermark = refs_watermark(".git")
+
+    assert refs_watermark(".git") == watermark
+
+    for command in [
+        ["tag", "v0.3.0"],
+        ["tag", "nested/v0.4.0"],
+        ["pack-refs", "--all"],
+        ["tag", "-d", "v0.1.0"],
+    ]:
+        git(*command)
+        new_watermark = refs_watermark(".git")
+
+        assert new_watermark != watermark
+        watermark = new_watermark
+
+
+def test_refs_watermark_in_worktree(worktree):
+    watermark = refs_watermark(find_git_dir())
+
+    assert watermark != [0, 0, 0, 0]
+
+    git("tag", "v0.3.0")
+
+    assert refs_watermark(find_git_dir()) != watermark
+
+
+def test_refs_watermark_without_ref_storage(repository):
+    os.mkdir(".git/reftable")
+
+    assert refs_watermark(".git") is None
+
+
+def test_version_index_cache_without_watermark(repository):
+    version_tags = Git.version_tags
+
+    with patch("braulio.cli.refs_watermark", return_value=None):
+        with patch.object(Git, "version_tags", autospec=True) as mock:
+            mock.side_effect = version_tags
+
+            _version_index(Git(), "v{version}")
+            index = _version_index(Git(), "v{version}")
+
+    assert mock.call_count == 2
+    assert index.latest() == Version("0.2.0")
+
+
+def test_version_index_cache(repository):
+    version_tags = Git.version_tags
+
+    with patch.object(Git, "version_tags", autospec=True) as mock:
+        mock.side_effect = version_tags
+
+        assert _version_index(Git(), "v{version}").latest() == Version("0.2.0")
+        assert _version_index(Git(), "v{version}").latest() == Version("0.2.0")
+        assert mock.call_count == 1
+
+        git("tag", "v0.3.0")
+        index = _version_index(Git(), "v{version}")
+
+        assert index.latest() == Version("0.3.0")
+        assert index.latest().tag.name == "v0.3.0"
+        assert mock.call_count == 2
+
+
+def test_version_index_newest(repository):
+    # A fix released on the maintenance line after the major release
+    for i, name in enumerate(["v1.2.4", "v2.0.0", "v1.2.5"]):
+        git("tag", "-a", name, "-m", "Release", date=f"{1900000000 + i * 60}")
+
+    for _ in range(2):
+        index = _version_index(Git(), "v{version}")
+
+        assert index.newest() == Version("1.2.5")
+        assert index.newest().tag.name == "v1.2.5"
+        assert index.latest() == Version("2.0.0")
+
+
+@parametrize("packed", [False, True], ids=["loose", "packed"])
+@parametrize(
+    "head, stop",
+    [("HEAD", None), ("HEAD", "v0.1.0"), ("HEAD", "v0.2.0"), ("feature", "v0.1.0")],
+)
+def test_walk_commits(repository, packed, head, stop):
+    if packed:
+        git("gc", "-q")
+
+    revision_range = f"{stop}..{head}" if stop else head
+    expected = git("log", "--format=%H", revision_range).split()
+
+    with ObjectStore(".git") as store:
+        commits = list(walk_commits(store, head, stop))
+
+    assert [commit.hash for commit in commits] == expected
+
+
+def test_commit_graph(repository):
+    assert CommitGraph.open(".git") is None
+
+    git("commit-graph", "write", "--reachable")
+    graph = CommitGraph.open(".git")
+
+    output = git("log", "--all", "--format=%H %P %ct")
+    commits = [line.split() for line in output.strip().split("\n")]
+
+    assert graph.size == len(commits)
+
+    for sha, *parents, timestamp in commits:
+        position = graph.position(sha)
+        parent_positions, generation, date = graph.commit_info(position)
+
+        assert graph.sha(position) == sha
+        assert [graph.sha(p) for p in parent_positions] == parents
+        assert date == int(timestamp)
+        assert generation >= 1
+
+    assert graph.position("0" * 40) is None
+    graph.close()
+
+
+def test_commit_graph_is_stale(repository):
+    with ObjectStore(".git") as store:
+        assert commit_graph_is_stale(store, None)
+
+        git("commit-graph", "write", "--reachable")
+        graph = CommitGraph.open(".git")
+
+        assert not commit_graph_is_stale(store, graph)
+        git("commit", "-q", "--allow-empty", "-m", "New commit")
+        assert commit_graph_is_stale(store, graph)
+
+        graph.close()
+
+
+@parametrize("new_commits", [0, 2])
+@parametrize(
+    "head, stop",
+    [("HEAD", None), ("HEAD", "v0.1.0"), ("HEAD", "v0.2.0"), ("feature", "v0.1.0")],
+)
+def test_walk_commits_with_graph(repository, new_commits, head, stop):
+    git("commit-graph", "write", "--reachable")
+
+    # Commits that aren't in the commit-graph yet
+    for i in range(new_commits):
+        git("commit", "-q", "--allow-empty", "-m", f"New {i}", date=f"{1600000000 + i}")
+
+    revision_range = f"{stop}..{head}" if stop else head
+    expected = git("log", "--format=%H", revision_range).split()
+
+    with ObjectStore(".git") as store:
+        graph = CommitGraph.open(".git")
+        commits = list(walk_commits(store, head, stop, graph=graph))
+        graph.close()
+
+    assert [commit.hash for commit in commits] == expected
+
+
+def build_skewed_history():
+    """Merge a branch whose commits are dated before the ones they follow,
+    so the date order and the generation order disagree."""
+
+    git("checkout", "-q", "-b", "skewed", "v0.2.0")
+
+    for i, name in enumerate(["skewed", "s1", "s2"]):
+        git("commit", "-q", "--allow-empty", "-m", name, date=f"{1400000000 + i}")
+
+    git("checkout", "-q", "-")
+    git("commit", "-q", "--allow-empty", "-m", "m1", date="1600000000")
+    git("merge", "-q", "--no-ff", "--no-edit", "skewed", date="1600000060")
+    git("commit", "-q", "--allow-empty", "-m", "final", date="1500000000")
+
+
+@parametrize("with_graph", [False, True], ids=["plain", "graph"])
+@parametrize("stop", [None, "v0.1.0", "v0.2.0"])
+def test_walk_commits_skewed_dates(repository, with_graph, stop):
+    build_skewed_history()
+
+    if with_graph:
+        # Part of the history is newer than the commit-graph
+        git("commit-graph", "write", "--reachable")
+        git("commit", "-q", "--allow-empty", "-m", "new", date="1450000000")
+
+    revision_range = f"{stop}..HEAD" if stop else "HEAD"
+    expected = git("log", "--format=%H", revision_range).split()
+
+    with ObjectStore(".git") as store:
+        graph = CommitGraph.open(".git")
+        commits = list(walk_commits(store, "HEAD", stop, graph=graph))
+
+        if graph is not None:
+            graph.close()
+
+    assert [commit.hash for commit in commits] == expected
+
+
+def test_git_objects_backend(repository):
+    for _from in [None, "v0.1.0"]:
+        expected = list(Git().iter_log(_from=_from))
+        commits = list(Git(backend="objects").iter_log(_from=_from))
+
+        assert [c.hash for c in commits] == [c.hash for c in expected]
+        assert [c.message for c in commits] == [c.message for c in expected]
+
+        git("commit-graph", "write", "--reachable")
+
+
+@pytest.fixture
+def worktree(repository, tmpdir):
+    """Add a linked worktree of the repository and switch to it."""
+
+    path = str(tmpdir / "worktree")
+    git("worktree", "add", "-q", path, "feature")
+    original_dir = os.getcwd()
+    os.chdir(path)
+    yield
+    os.chdir(original_dir)
+
+
+def test_git_version_tags_in_worktree(worktree):
+    tags = Git().version_tags("v{version}", Version)
+
+    assert [tag.name for tag in tags] == ["v0.1.0", "v0.2.0"]
+
+
+def test_git_version_tags_without_ref_storage(repository):
+    with patch.object(ObjectStore, "has_ref_storage", False):
+        with patch.object(ObjectStore, "tags") as mock:
+            tags = Git().version_tags("v{version}", Version)
+
+    mock.assert_not_called()
+    assert [tag.name for tag in tags] == ["v0.1.0", "v0.2.0"]
+
+
+@parametrize("packed", [False, True], ids=["loose", "packed"])
+def test_worktree(worktree, packed):
+    if packed:
+        git("gc", "-q")
+
+    git_dir = find_git_dir()
+
+    with ObjectStore(git_dir) as store:
+        assert store.common_dir != git_dir
+        assert store.has_ref_storage
+
+        for rev in ["HEAD", "feature", "v0.1.0", "v0.2.0"]:
+            assert store.resolve(rev) == git("rev-parse", rev).strip()
+
+        assert [tag.name for tag in store.tags()] == ["v0.1.0", "v0.2.0"]
+
+    for _from in [None, "v0.1.0"]:
+        expected = list(Git().iter_log(_from=_from))
+        commits = list(Git(backend="objects").iter_log(_from=_from))
+
+        assert [c.hash for c in commits] == [c.hash for c in expected]
+
+
+def test_alternates(repository, tmpdir):
+    git("gc", "-q")
+    path = str(tmpdir / "clone")
+    git("clone", "-q", "--shared", ".", path)
+    os.chdir(path)
+    git("config", "user.name", "A")
+    git("config", "user.email", "a@a.test")
+    git("commit", "-q", "--allow-empty", "-m", "Only in the clone")
+
+    objects = all_objects()
+
+    with ObjectStore(".git") as store:
+        assert len(store.object_dirs) == 2
+
+        for sha, object_type in objects:
+            assert store.read_object(sha)[1] == object_type
+
+
+def test_read_through_session(repository, tmpdir, monkeypatch):
+    git("gc", "-q")
+    objects_dir = os.path.abspath(".git/objects")
+    path = str(tmpdir / "clone")
+    git("clone", "-q", "--shared", ".", path)
+    os.chdir(path)
+
+    # Only git knows where the objects are
+    os.remove(".git/objects/info/alternates")
+    monkeypatch.setenv("GIT_ALTERNATE_OBJECT_DIRECTORIES", objects_dir)
+
+    with ObjectStore(".git") as store:
+        with pytest.raises(KeyError):
+            store.tags()
+
+    expected = [commit.hash for commit in Git().iter_log()]
+
+    with Git(backend="objects") as repository_git:
+        with patch.object(Git, "tag") as mock_tag:
+            tags = repository_git.version_tags("v{version}", Version)
+
+        commits = list(repository_git.iter_log())
+        session = repository_git.session
+
+        mock_tag.assert_not_called()
+        assert [tag.name for tag in tags] == ["v0.1.0", "v0.2.0"]
+        assert [commit.hash for commit in commits] == expected
+        assert session._processes
+
+    assert session._processes == {}
+
+
+def test_reftable_falls_back_to_git(repository):
+    with patch.object(ObjectStore, "has_ref_storage", False):
+        with patch("braulio.objects.walk_commits") as mock:
+            commits = list(Git(backend="objects").iter_log())
+
+    mock.assert_not_called()
+    assert [c.hash for c in commits] == [c.hash for c in Git().iter_log()]
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        Git(backend="lorem")
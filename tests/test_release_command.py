@@ -6,7 +6,7 @@ from pathlib import Path
 from click import Context
 from click.exceptions import UsageError
 from click.testing import CliRunner
-from braulio.git import Tag
+from braulio.git import Commit, Tag
 from braulio.version import Version, Stage
 from braulio.cli import (
     cli,
@@ -24,6 +24,25 @@ parametrize = pytest.mark.parametrize
 
 FakeTag = namedtuple("FakeTag", ["name"])
 
+# A commit without label. It gives the release command something to release
+# without altering the release data.
+unlabeled_commit = Commit(
+    "commit 80a9e0edf6208b3c1c9bc28bfb1a5f04b1f59e1d\n"
+    "Author: H. Rackham <henry.rackham@xyz.test>\n"
+    "Date:   Wed Apr 18 13:39:55 2018 -0700\n"
+    "\n"
+    "    Stop being lazy\n"
+)
+
+
+@pytest.fixture(autouse=True)
+def no_git_dir():
+    """Git is mocked, so keep the caches of the release command away from
+    the repository the tests run in."""
+
+    with patch("braulio.cli.git_dir", return_value=None):
+        yield
+
 
 @pytest.fixture
 def ctx():
@@ -41,20 +60,22 @@ def ctx():
 @patch("braulio.cli.Git", autospec=True)
 def test_call_to_git_log_method(MockGit, tag_list, from_arg):
     mock_git = MockGit()
-    mock_git.tags = tag_list
-    mock_git.log.return_value = []
+    mock_git.version_tags.return_value = tag_list
+    mock_git.iter_log.return_value = []
     runner = CliRunner()
 
     result = runner.invoke(cli, ["release"])
 
     assert result.exit_code == 0
-    mock_git.log.assert_called_with(_from=from_arg)
+    mock_git.iter_log.assert_called_with(_from=from_arg)
+    # The cat-file processes of the session are terminated
+    mock_git.close.assert_called()
 
 
 @patch("braulio.cli.Git", autospec=True)
 def test_commitless_repository(MockGit):
     mock_git = MockGit()
-    mock_git.log.return_value = []
+    mock_git.iter_log.return_value = []
     runner = CliRunner()
 
     result = runner.invoke(cli, ["release"])
@@ -70,6 +91,7 @@ def test_commitless_repository(MockGit):
 @patch("braulio.cli.Git", autospec=True)
 def test_confirmation_prompt(MockGit, mock_update_chglog, _input, isolated_filesystem):
 
+    MockGit().iter_log.return_value = [unlabeled_commit]
     runner = CliRunner()
 
     with isolated_filesystem("HISTORY.rst"):
@@ -125,7 +147,8 @@ def test_manual_version_bump(
 ):
 
     mock_git = MockGit()
-    mock_git.tags = tags
+    mock_git.iter_log.return_value = [unlabeled_commit]
+    mock_git.version_tags.return_value = tags
     runner = CliRunner()
 
     with isolated_filesystem("HISTORY.rst"):
@@ -140,6 +163,8 @@ def test_manual_version_bump(
             new_version=Version(expected),
             release_data={},
             remove=ANY,
+            transaction=ANY,
+            index=ANY,
         )
 
         mock_git.commit.assert_called_with(
@@ -152,7 +177,8 @@ def test_manual_version_bump(
 def test_bump_to_a_lower_version(MockGit, isolated_filesystem):
 
     mock_git = MockGit()
-    mock_git.tags = [FakeTag("v2.0.0")]
+    mock_git.iter_log.return_value = [unlabeled_commit]
+    mock_git.version_tags.return_value = [FakeTag("v2.0.0")]
     runner = CliRunner()
 
     with isolated_filesystem("HISTORY.rst"):
@@ -186,8 +212,10 @@ def test_determine_next_version_from_commit_messages(
     isolated_filesystem,
 ):
     mock_git = MockGit()
-    mock_git.tags = tags
-    mock_git.log.return_value = [commit_registry[short_hash] for short_hash in hash_lst]
+    mock_git.version_tags.return_value = tags
+    mock_git.iter_log.return_value = [
+        commit_registry[short_hash] for short_hash in hash_lst
+    ]
 
     runner = CliRunner()
 
@@ -212,8 +240,8 @@ def test_determine_next_version_from_commit_messages(
 def test_release_from_pre_release_stage(MockGit, commit_list, isolated_filesystem):
     runner = CliRunner()
     mock_git = MockGit()
-    mock_git.tags = [FakeTag("v1.3.1beta5")]
-    mock_git.log.return_value = commit_list
+    mock_git.version_tags.return_value = [FakeTag("v1.3.1beta5")]
+    mock_git.iter_log.return_value = commit_list
 
     with isolated_filesystem("HISTORY.rst"):
         # Add first pre-release stages to config file
@@ -247,17 +275,18 @@ def test_call_to_update_changelog(
 ):
     runner = CliRunner()
     mock_git = MockGit()
-    mock_git.tags = []
+    mock_git.iter_log.return_value = [unlabeled_commit]
+    mock_git.version_tags.return_value = []
 
     with isolated_filesystem("HISTORY.rst"):
         result = runner.invoke(cli, ["release", "-y"])
 
         assert result.exit_code == 0
 
-        mock_git.log.assert_called()
+        mock_git.iter_log.assert_called()
 
         mock_commit_analyzer.assert_called_with(
-            mock_git.log(), "!{type}:{scope}", "footer"
+            ANY, "!{type}:{scope}", "footer", workers=1
         )
 
         MockReleaseDataTree.assert_called_with(mock_commit_analyzer())
@@ -274,6 +303,8 @@ def test_call_to_update_changelog(
             new_version=mock_get_next_version(),
             release_data=release_data,
             remove=ANY,
+            transaction=ANY,
+            index=ANY,
         )
 
 
@@ -297,7 +328,8 @@ def test_merge_pre_option(
     MockGit, mock_update_chglog, isolated_filesystem, tags, options, expected
 ):
     mock_git = MockGit()
-    mock_git.tags = tags
+    mock_git.iter_log.return_value = [unlabeled_commit]
+    mock_git.version_tags.return_value = tags
 
     with isolated_filesystem("HISTORY.rst"):
         path = Path("setup.cfg")
@@ -314,7 +346,13 @@ def test_merge_pre_option(
         assert result.exit_code == 0
 
         mock_update_chglog.assert_called_with(
-            ANY, current_version=ANY, new_version=ANY, release_data=ANY, remove=expected
+            ANY,
+            current_version=ANY,
+            new_version=ANY,
+            release_data=ANY,
+            remove=expected,
+            transaction=ANY,
+            index=ANY,
         )
 
 
@@ -354,7 +392,8 @@ def test_files_argument_from_command_line(mock_update_files, MockGit, fake_repos
 
     runner = CliRunner()
     mock_git = MockGit()
-    mock_git.tags = []
+    mock_git.iter_log.return_value = [unlabeled_commit]
+    mock_git.version_tags.return_value = []
 
     with fake_repository("black"):
         files = ["black/__init__.py", "setup.py"]
@@ -362,24 +401,50 @@ def test_files_argument_from_command_line(mock_update_files, MockGit, fake_repos
 
     assert result.exit_code == 0, result.exception
     mock_update_files.assert_called_with(
-        ("black/__init__.py", "setup.py"), "0.0.0", "0.0.1"
+        ("black/__init__.py", "setup.py"),
+        "0.0.0",
+        "0.0.1",
+        transaction=ANY,
+        max_workers=1,
     )
 
 
+@patch("braulio.cli.Git", autospec=True)
+def test_files_updated_in_parallel(MockGit, fake_repository):
+
+    runner = CliRunner()
+    mock_git = MockGit()
+    mock_git.iter_log.return_value = [unlabeled_commit]
+    mock_git.version_tags.return_value = [FakeTag("v4.1.3")]
+
+    with fake_repository("black"):
+        files = ["black/__init__.py", "setup.py"]
+        result = runner.invoke(cli, ["release", "-y", "--jobs", "4"] + files)
+
+        assert result.exit_code == 0, result.exception
+        assert "__version__ = '4.1.4'" in Path("black/__init__.py").read_text()
+        assert "version='4.1.4'" in Path("setup.py").read_text()
+
+
 @patch("braulio.cli.Git", autospec=True)
 @patch("braulio.cli.update_files", autospec=True)
 def test_files_argument_from_config_file(mock_update_files, MockGit, fake_repository):
 
     runner = CliRunner()
     mock_git = MockGit()
-    mock_git.tags = []
+    mock_git.iter_log.return_value = [unlabeled_commit]
+    mock_git.version_tags.return_value = []
 
     with fake_repository("white"):
         result = runner.invoke(cli, ["release", "-y"])
 
     assert result.exit_code == 0
     mock_update_files.assert_called_with(
-        ("white/__init__.py", "setup.py"), "0.0.0", "0.0.1"
+        ("white/__init__.py", "setup.py"),
+        "0.0.0",
+        "0.0.1",
+        transaction=ANY,
+        max_workers=1,
     )
 
 
@@ -389,7 +454,8 @@ def test_added_files_to_release_commit(mock_update_files, MockGit, fake_reposito
 
     runner = CliRunner()
     mock_git = MockGit()
-    mock_git.tags = []
+    mock_git.iter_log.return_value = [unlabeled_commit]
+    mock_git.version_tags.return_value = []
 
     with fake_repository("white"):
         result = runner.invoke(cli, ["release", "--commit", "-y"])
@@ -408,8 +474,8 @@ def test_output_after_confirmation_prompt(
 
     runner = CliRunner()
     mock_git = MockGit()
-    mock_git.tags = [FakeTag("v0.2.0")]
-    mock_git.log.return_value = commit_list
+    mock_git.version_tags.return_value = [FakeTag("v0.2.0")]
+    mock_git.iter_log.return_value = commit_list
 
     with isolated_filesystem("HISTORY.rst"):
         result = runner.invoke(cli, ["release"] + options)
@@ -437,8 +503,8 @@ def test_output_before_confirmation_prompt(
 
     runner = CliRunner()
     mock_git = MockGit()
-    mock_git.tags = [Tag("v0.2.0")]
-    mock_git.log.return_value = commit_list
+    mock_git.version_tags.return_value = [Tag("v0.2.0")]
+    mock_git.iter_log.return_value = commit_list
 
     with isolated_filesystem("HISTORY.rst"):
         result = runner.invoke(cli, ["release"] + options, input="y")
@@ -484,6 +550,7 @@ def test_label_pattern_option(
     MockGit, mock_commit_analyzer, cfg, option, isolated_filesystem
 ):
 
+    MockGit().iter_log.return_value = [unlabeled_commit]
     runner = CliRunner()
 
     with isolated_filesystem("HISTORY.rst", cfg=cfg):
@@ -491,10 +558,29 @@ def test_label_pattern_option(
 
         assert result.exit_code == 0
         mock_commit_analyzer.assert_called_with(
-            MockGit().log(), "{type}:{scope}", "footer"
+            ANY, "{type}:{scope}", "footer", workers=1
         )
 
 
+@patch("braulio.cli.commit_analyzer", autospec=True)
+@patch("braulio.cli.Git", autospec=True)
+def test_jobs_option(MockGit, mock_commit_analyzer, isolated_filesystem):
+    MockGit().iter_log.return_value = [unlabeled_commit]
+    runner = CliRunner()
+
+    with isolated_filesystem("HISTORY.rst"):
+        result = runner.invoke(cli, ["release", "--jobs=4"])
+
+        assert result.exit_code == 0
+        mock_commit_analyzer.assert_called_with(
+            ANY, "!{type}:{scope}", "footer", workers=4
+        )
+
+        result = runner.invoke(cli, ["release", "--jobs=0"])
+
+        assert result.exit_code == 2
+
+
 @parametrize(
     "flag, cfg, called",
     [
@@ -509,6 +595,7 @@ def test_commit_flag(MockGit, flag, cfg, called, isolated_filesystem):
     """Test commit flag picked from CLI or configuration file"""
 
     mock_git = MockGit()
+    mock_git.iter_log.return_value = [unlabeled_commit]
     runner = CliRunner()
 
     with isolated_filesystem("HISTORY.rst", cfg=cfg):
@@ -534,6 +621,7 @@ def test_tag_flag(MockGit, flag, cfg, called, isolated_filesystem):
     """Test tag flag picked from CLI or configuration file"""
 
     mock_git = MockGit()
+    mock_git.iter_log.return_value = [unlabeled_commit]
     runner = CliRunner()
 
     with isolated_filesystem("HISTORY.rst", cfg=cfg):
@@ -576,7 +664,8 @@ def test_message_option_validator_with_invalid_value(ctx, value):
 @patch("braulio.cli.Git")
 def test_message_option(MockGit, isolated_filesystem, cfg, option, expected):
     mock_git = MockGit()
-    mock_git.tags = [FakeTag(name="v8.0.0")]
+    mock_git.iter_log.return_value = [unlabeled_commit]
+    mock_git.version_tags.return_value = [FakeTag(name="v8.0.0")]
     runner = CliRunner()
 
     with isolated_filesystem("HISTORY.rst", cfg=cfg):
@@ -617,7 +706,8 @@ def test_tag_pattern_option(MockGit, isolated_filesystem, options, cfg, expected
     """Test tag options picked from CLI or configuration file"""
 
     mock_git = MockGit()
-    mock_git.tags = []
+    mock_git.iter_log.return_value = [unlabeled_commit]
+    mock_git.version_tags.return_value = []
     runner = CliRunner()
 
     with isolated_filesystem("HISTORY.rst", cfg=cfg):
@@ -655,7 +745,7 @@ def test_current_version_option_validator(
     MockGit, tags, value, expected_version, expected_tag
 ):
     mock_git = MockGit()
-    mock_git.tags = tags
+    mock_git.version_tags.return_value = tags
     ctx = Context(release)
     ctx.params["tag_pattern"] = "v{version}"
 
@@ -682,7 +772,7 @@ def test_update_current_version_config_file_option(
 ):
 
     mock_git = MockGit()
-    mock_git.tags = [FakeTag(name="v2.0.0")]
+    mock_git.version_tags.return_value = [FakeTag(name="v2.0.0")]
     runner = CliRunner()
 
     with isolated_filesystem("HISTORY.rst", cfg=cfg):
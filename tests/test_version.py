@@ -1,10 +1,14 @@
+import re
 import pytest
+import random
 from unittest.mock import patch as mock_patch
 from collections import OrderedDict
 from braulio.version import (
     validate_version_str,
     Version,
+    VersionIndex,
     get_next_version,
+    top_versions,
     parse_version_string_parts,
     Stage,
 )
@@ -125,6 +129,44 @@ class TestVersion:
 
             assert version.string == expected
 
+    def test_slots(self):
+        assert not hasattr(Version("1.2.3"), "__dict__")
+
+    def test_lazy_string(self, stages):
+        with mock_patch.object(Version, "stages", stages):
+            version = Version("2.1.0beta1")
+
+        # The serializer of the stages at creation time is used
+        assert version._string is None
+        assert version.string == "2.1.0beta1"
+        assert version._string == "2.1.0beta1"
+
+    def test_stages_replaced(self, stages):
+        with mock_patch.object(Version, "stages", stages):
+            assert Version("2.1.0beta1")._stage_number == 1
+
+        with pytest.raises(ValueError):
+            Version("2.1.0beta1")
+
+    def test_parse_many(self, stages):
+        strings = ["1.2.3", "invalid", "0.1.0.dev2", "10.0.0", "1.2", "1.2.3beta1"]
+
+        with mock_patch.object(Version, "stages", stages):
+            versions = Version.parse_many(strings)
+            expected = sorted(Version(s) for s in strings if validate_version_str(s))
+
+        assert [v.string for v in versions] == [v.string for v in expected]
+        assert Version.parse_many([]) == []
+
+    def test_parse_many_unknown_stage(self):
+        versions = Version.parse_many(["1.0.0", "1.0.0rc1", "0.9.0"])
+
+        assert [v.string for v in versions] == ["0.9.0", "1.0.0"]
+
+        with pytest.raises(ValueError, match="rc is an unknown stage"):
+            pattern = re.compile(Version.pattern)
+            list(Version.from_matches([pattern.match("1.0.0rc1")]))
+
     def test_unknown_stage(self):
         error = "gama is an unknown stage"
 
@@ -243,6 +285,12 @@ class TestVersion:
         with pytest.raises(TypeError, match=error_message):
             left != right
 
+    def test_hash(self):
+        versions = [Version("1.0.0"), Version("1.0"), Version("1.1.0"), Version("1")]
+
+        assert set(versions) == {Version("1.0.0"), Version("1.1.0")}
+        assert {Version("1.1"): "x"}[Version("1.1.0")] == "x"
+
     def test_repr(self):
         assert repr(Version("3.2.1")) == "Version('3.2.1')"
 
@@ -327,3 +375,156 @@ def test_get_next_version(current, bump_to, stage, expected, stages):
         new_version = get_next_version(current, bump_to, stage)
 
         assert new_version == expected
+
+
+index_versions = ["0.1.0", "0.2.0.dev0", "0.2.0beta0", "0.2.0", "1.0.0beta1", "0.9.1"]
+
+
+@parametrize(
+    "method, args, expected",
+    [
+        ("get", ["0.2.0"], "0.2.0"),
+        ("get", ["0.3.0"], None),
+        ("floor", ["0.2.0beta0"], "0.2.0beta0"),
+        ("floor", ["0.5.0"], "0.2.0"),
+        ("floor", ["0.0.1"], None),
+        ("floor", ["2.0.0"], "1.0.0beta1"),
+        ("previous_final", ["1.0.0beta1"], "0.9.1"),
+        ("previous_final", ["0.2.0"], "0.1.0"),
+        ("previous_final", ["0.1.0"], None),
+        ("latest", [], "1.0.0beta1"),
+        ("latest", ["final"], "0.9.1"),
+        ("latest", ["dev"], "0.2.0.dev0"),
+    ],
+)
+def test_version_index(method, args, expected, stages):
+    with mock_patch.object(Version, "stages", stages):
+        index = VersionIndex(Version(string) for string in index_versions)
+        args = [arg if arg in stages else Version(arg) for arg in args]
+
+        version = getattr(index, method)(*args)
+
+        assert (version.string if version else None) == expected
+        assert [v.string for v in index] == sorted(index_versions, key=Version)
+
+
+def test_version_index_duplicates():
+    newest, oldest = Version("1.0.0"), Version("1.0")
+
+    index = VersionIndex([newest, oldest])
+
+    assert len(index) == 1
+    assert index.get(Version("1")) is newest
+    assert VersionIndex().latest() is None
+
+
+def test_version_index_newest():
+    versions = [Version("1.2.5"), Version("2.0.0"), Version("1.2.4")]
+
+    assert VersionIndex(versions).newest() is versions[0]
+    assert VersionIndex(versions, newest=versions[1]).newest() is versions[1]
+    assert VersionIndex(versions).latest() is versions[1]
+    assert VersionIndex().newest() is None
+
+
+def random_versions(rng, stages, size):
+    """Random versions with parts of any size, many of them repeated."""
+
+    bounds = [rng.choice([3, 999, 1000, 10 ** 12]) for _ in range(4)]
+    versions = []
+
+    for _ in range(size):
+        major, minor, patch, n = (rng.randint(0, bound) for bound in bounds)
+        stage = rng.choice(list(stages))
+        version = Version(major=major, minor=minor, patch=patch, stage=stage, n=n)
+        versions.append(version)
+
+    return versions
+
+
+def expected_key(version, stages):
+    return (
+        version.major,
+        version.minor,
+        version.patch,
+        list(stages).index(version.stage),
+        version.n,
+    )
+
+
+@parametrize("seed", range(20))
+def test_order_matches_parts_order(seed, stages):
+    rng = random.Random(seed)
+
+    with mock_patch.object(Version, "stages", stages):
+        versions = random_versions(rng, stages, 200)
+
+    key = lambda version: expected_key(version, stages)  # noqa: E731
+    assert [key(v) for v in sorted(versions)] == sorted(key(v) for v in versions)
+
+    for left, right in zip(versions, reversed(versions)):
+        assert (left < right) is (key(left) < key(right))
+        assert (left == right) is (key(left) == key(right))
+        assert (left <= right) is (key(left) <= key(right))
+        assert (left > right) is (key(left) > key(right))
+        assert (left >= right) is (key(left) >= key(right))
+        assert (left != right) is (key(left) != key(right))
+        assert (hash(left) == hash(right)) or left != right
+
+
+@parametrize("seed", range(20))
+def test_version_index_matches_linear_scan(seed, stages):
+    rng = random.Random(seed)
+
+    with mock_patch.object(Version, "stages", stages):
+        versions = random_versions(rng, stages, 100)
+        index = VersionIndex(versions)
+
+        for version in random_versions(rng, stages, 50) + versions[:10]:
+            lower = [v for v in versions if v <= version]
+            floor = index.floor(version)
+
+            assert floor == max(lower) if lower else floor is None
+
+            finals = [v for v in versions if v < version and v.stage == "final"]
+            previous_final = index.previous_final(version)
+
+            if finals:
+                assert previous_final == max(finals)
+            else:
+                assert previous_final is None
+
+
+@parametrize(
+    "lower, higher",
+    [
+        ("2024.999.0", "2024.1001.0"),
+        ("1.0.0beta999", "1.0.0beta1000"),
+        ("999.999.999", "1000.0.0"),
+        ("1.0.0.dev12345", "1.0.0beta0"),
+    ],
+)
+def test_large_parts(lower, higher, stages):
+    with mock_patch.object(Version, "stages", stages):
+        assert Version(lower) < Version(higher)
+        assert not Version(higher) <= Version(lower)
+
+
+@parametrize("seed", range(10))
+def test_top_versions(seed, stages):
+    rng = random.Random(seed)
+
+    with mock_patch.object(Version, "stages", stages):
+        versions = random_versions(rng, stages, 300)
+
+    for k in [0, 1, 5, 1000]:
+        expected = sorted(set(versions), reverse=True)[:k]
+
+        assert top_versions(versions, k) == expected
+        assert top_versions(versions, k, unique=False) == sorted(versions)[::-1][:k]
+
+
+def test_top_versions_keeps_first():
+    first, second = Version("1.0.0"), Version("1.0")
+
+    assert top_versions([first, Version("0.1.0"), second], 1)[0] is first